@@ -0,0 +1,38 @@
+# Конфигурация gunicorn для запуска в production: несколько процессов-воркеров uvicorn
+#
+# Запуск: gunicorn -c gunicorn.conf.py main:app
+# Каждый воркер создает собственный клиент MongoDB при запуске (после fork), миграции
+# применяются один раз в главном процессе до запуска воркеров.
+
+import asyncio
+import multiprocessing
+import os
+
+# Адрес и число воркеров (по умолчанию - по числу ядер процессора)
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Время на обработку запроса и на корректное завершение воркера, с
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# Перезапуск воркеров после заданного числа запросов (0 - без перезапуска)
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "0"))
+
+accesslog = "-"
+
+
+# Миграции в главном процессе до запуска воркеров (вместо одновременного запуска в каждом).
+# При ошибке флаг не сбрасывается: воркеры повторяют миграции при запуске (под арендой)
+def on_starting(server):
+    import main
+
+    if main.RUN_MIGRATIONS_ON_STARTUP:
+        try:
+            asyncio.run(main.run_command("migrate"))
+            main.RUN_MIGRATIONS_ON_STARTUP = False
+        except Exception as e:
+            server.log.error(f"Failed to apply migrations: {e}")
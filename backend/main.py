@@ -1,69 +1,291 @@
 # Импорт необходимых библиотек
-from fastapi import FastAPI, Query
-from pymongo import MongoClient
+from fastapi import FastAPI, HTTPException, Query, Request, Header
+from fastapi.responses import JSONResponse, StreamingResponse, Response, PlainTextResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
+from pymongo import MongoClient, AsyncMongoClient, ASCENDING, DESCENDING, TEXT, ReplaceOne, UpdateOne, InsertOne, DeleteOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure, PyMongoError
+from pymongo import monitoring
+from starlette.routing import Match
 from bson import ObjectId
-from pydantic import BaseModel, Field, field_validator, model_validator
-from typing import Optional, List
+from bson.errors import InvalidId
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
+from typing import Optional, List, Literal, Annotated
 from enum import Enum
-from datetime import datetime
+from datetime import datetime, date, timezone, timedelta
+from email.utils import format_datetime, parsedate_to_datetime
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+import orjson
 import logging
 import json
 import os
+import base64
+import threading
+import time
+import argparse
+import asyncio
+import itertools
+import csv
+import io
+import re
+import hashlib
+import math
+import contextvars
+import socket
+from collections import OrderedDict
 
 #НАСТРОЙКА ЛОГИРОВАНИЯ
 # Конфигурация логирования для отслеживания работы приложения
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+#ЖИЗНЕННЫЙ ЦИКЛ ПРИЛОЖЕНИЯ
+# Применять миграции (индексы) при запуске сервера
+RUN_MIGRATIONS_ON_STARTUP = os.getenv("RUN_MIGRATIONS_ON_STARTUP", "1") == "1"
+
+# Запускать фоновое преобразование ссылок в ObjectId при запуске сервера
+MIGRATE_REFERENCES_ON_STARTUP = os.getenv("MIGRATE_REFERENCES_ON_STARTUP", "1") == "1"
+
+# Действия при запуске и остановке сервера: подключение к MongoDB, миграции, фоновые задачи, закрытие соединений
+@asynccontextmanager
+async def lifespan(app):
+    # Сервер запускается и при недоступной MongoDB: готовность показывает /readyz
+    await connect_mongo(required=False)
+    
+    if RUN_MIGRATIONS_ON_STARTUP:
+        # При нескольких воркерах миграции применяет только один из них
+        try:
+            await run_exclusive("migrations", run_migrations, db)
+        except Exception as e:
+            logger.error(f"Failed to apply migrations: {str(e)}")
+    
+    background_tasks = []
+    if MIGRATE_REFERENCES_ON_STARTUP:
+        # При нескольких воркерах миграцию выполняет только один из них
+        background_tasks.append(asyncio.create_task(run_background_job("references migration", run_exclusive, "references_migration", migrate_references, db)))
+    if ARCHIVE_INTERVAL_HOURS > 0:
+        background_tasks.append(asyncio.create_task(run_background_job("archiving", archive_periodically)))
+    if LIVE_UPDATES:
+        background_tasks.append(asyncio.create_task(run_background_job("live updates change stream", watch_live_updates)))
+        background_tasks.append(asyncio.create_task(run_background_job("live updates delivery", flush_live_updates)))
+    
+    yield
+    
+    for task in background_tasks:
+        task.cancel()
+    
+    # Обновление имен в статьях дожидается завершения; прерванное по таймауту
+    # исправляет команда check-names --fix
+    if name_fanout_tasks:
+        _, pending = await asyncio.wait(set(name_fanout_tasks), timeout=NAME_FANOUT_SHUTDOWN_TIMEOUT)
+        if pending:
+            logger.warning(f"{len(pending)} name updates did not finish before shutdown, run 'check-names --fix'")
+        for task in pending:
+            task.cancel()
+        background_tasks.extend(pending)
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await close_mongo()
+
+#СЕРИАЛИЗАЦИЯ ОТВЕТОВ
+
+# Кодирование типов, которые orjson не поддерживает сам (ObjectId -> строка)
+def encode_mongo_value(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+# JSON-ответ на orjson: документы MongoDB (ObjectId, datetime) кодируются за один проход
+# без промежуточных копий. Эндпоинты, возвращающие документы, создают этот ответ напрямую,
+# чтобы FastAPI не обходил данные jsonable_encoder.
+class MongoJSONResponse(JSONResponse):
+    def __init__(self, content, *args, **kwargs):
+        super().__init__(content, *args, **kwargs)
+        # Ошибки возвращаются со статусом 200 в виде {"error": ...}: такие ответы не кэшируются
+        # и не получают ETag (иначе браузер повторял бы запрос с If-None-Match и получал 304)
+        if isinstance(content, dict) and "error" in content:
+            self.headers.setdefault("Cache-Control", "no-store")
+    
+    def render(self, content):
+        return orjson.dumps(content, default=encode_mongo_value)
+
 #СОЗДАНИЕ ПРИЛОЖЕНИЯ FASTAPI
 # Инициализация FastAPI приложения с метаданными
-app = FastAPI(title="Blog Admin Panel", description="API for managing blog content")
-
-#НАСТРОЙКА CORS
-# Настройка политики CORS для взаимодействия с frontend приложениями
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:8080", "http://localhost:3000"],  # Разрешенные домены
-    allow_credentials=True,
-    allow_methods=["*"],  # Разрешить все HTTP методы
-    allow_headers=["*"],  # Разрешить все заголовки
+app = FastAPI(
+    title="Blog Admin Panel",
+    description="API for managing blog content",
+    lifespan=lifespan,
+    default_response_class=MongoJSONResponse
 )
 
-#КЛАСС ДЛЯ СЕРИАЛИЗАЦИИ JSON
-# Кастомный JSON-кодер для корректной обработки ObjectId MongoDB
-class JSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, ObjectId):
-            return str(o)  # Преобразуем ObjectId в строку
-        return json.JSONEncoder.default(self, o)
-
-#ФУНКЦИИ ДЛЯ РАБОТЫ С ObjectId
-# Рекурсивная функция для конвертации всех ObjectId в строки
-def convert_objectid(data):
-    if isinstance(data, list):
-        return [convert_objectid(item) for item in data]
-    if isinstance(data, dict):
-        for key, value in data.items():
-            if isinstance(value, ObjectId):
-                data[key] = str(value)
-            elif isinstance(value, list):
-                data[key] = convert_objectid(value)
-            elif isinstance(value, dict):
-                data[key] = convert_objectid(value)
-    return data
+#СЖАТИЕ ОТВЕТОВ
+# Ответы больше GZIP_MINIMUM_SIZE байт сжимаются gzip, если клиент его принимает
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
 
 #ПОДКЛЮЧЕНИЕ К БАЗЕ ДАННЫХ MONGODB
-try:
-    # Создание подключения к MongoDB (локальный сервер по умолчанию)
-    mongo_url = os.getenv("MONGO_URL", "mongodb://mongo:27017/")
-    client = MongoClient(mongo_url)
-    db = client["blog_admin_db"]  # Выбор базы данных
-    logger.info("Connected to MongoDB successfully")
-except Exception as e:
-    logger.error(f"Failed to connect to MongoDB: {str(e)}")
-    raise
+# Адрес MongoDB (локальный сервер по умолчанию) и имя базы данных
+mongo_url = os.getenv("MONGO_URL", "mongodb://mongo:27017/")
+DATABASE_NAME = "blog_admin_db"
+
+# Драйвер: async - AsyncMongoClient (по умолчанию), sync - MongoClient с вызовами в пуле потоков
+MONGO_DRIVER = os.getenv("MONGO_DRIVER", "async")
+
+# Размеры пула соединений с MongoDB (на каждый процесс-воркер)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+
+# Число соединений, которые пул открывает одновременно (сглаживает всплеск при холодном старте)
+MONGO_MAX_CONNECTING = int(os.getenv("MONGO_MAX_CONNECTING", "2"))
+
+# Время ожидания доступного сервера MongoDB, мс
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+# Клиент и база данных создаются при запуске приложения (см. lifespan)
+client = None
+db = None
+
+# Асинхронная обертка над курсором синхронного драйвера:
+# sort/limit/skip настраивают курсор, чтение документов выполняется в пуле потоков
+class ThreadedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+    
+    def __getattr__(self, name):
+        method = getattr(self._cursor, name)
+        
+        def chain(*args, **kwargs):
+            method(*args, **kwargs)
+            return self
+        return chain
+    
+    # Чтение документов курсора (все или не более length)
+    async def to_list(self, length=None):
+        return await run_in_threadpool(lambda: list(itertools.islice(self._cursor, length)))
+    
+    async def explain(self):
+        return await run_in_threadpool(self._cursor.explain)
+    
+    async def close(self):
+        await run_in_threadpool(self._cursor.close)
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        doc = await run_in_threadpool(next, self._cursor, None)
+        if doc is None:
+            raise StopAsyncIteration
+        return doc
+
+# Асинхронная обертка над коллекцией синхронного драйвера (тот же интерфейс, что у AsyncCollection)
+class ThreadedCollection:
+    def __init__(self, collection):
+        self._collection = collection
+    
+    def find(self, *args, **kwargs):
+        return ThreadedCursor(self._collection.find(*args, **kwargs))
+    
+    async def aggregate(self, *args, **kwargs):
+        return ThreadedCursor(await run_in_threadpool(self._collection.aggregate, *args, **kwargs))
+    
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+        
+        async def call(*args, **kwargs):
+            return await run_in_threadpool(method, *args, **kwargs)
+        return call
+
+# Асинхронная обертка над базой данных синхронного драйвера
+class ThreadedDatabase:
+    def __init__(self, database):
+        self._database = database
+    
+    def __getitem__(self, name):
+        return ThreadedCollection(self._database[name])
+    
+    def __getattr__(self, name):
+        attr = getattr(self._database, name)
+        if hasattr(attr, "find_one"):
+            return ThreadedCollection(attr)
+        
+        async def call(*args, **kwargs):
+            return await run_in_threadpool(attr, *args, **kwargs)
+        return call
+
+# Создание клиента MongoDB для выбранного драйвера
+def create_mongo_client():
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxConnecting": MONGO_MAX_CONNECTING,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "event_listeners": [MongoCommandListener(), MongoPoolListener()]  # Метрики (см. раздел МЕТРИКИ)
+    }
+    if MONGO_DRIVER == "sync":
+        return MongoClient(mongo_url, **options)
+    return AsyncMongoClient(mongo_url, **options)
+
+# Подключение к MongoDB и проверка доступности сервера.
+# Клиент создается в каждом процессе при запуске (после fork воркера), соединения
+# открываются лениво. required=False - недоступность сервера не прерывает запуск.
+async def connect_mongo(required=True):
+    global client, db
+    client = create_mongo_client()
+    if MONGO_DRIVER == "sync":
+        db = ThreadedDatabase(client[DATABASE_NAME])
+    else:
+        db = client[DATABASE_NAME]
+    
+    try:
+        await db.command("ping")
+        logger.info(f"Connected to MongoDB successfully ({MONGO_DRIVER} driver)")
+    except Exception as e:
+        logger.error(f"Failed to connect to MongoDB: {str(e)}")
+        if required:
+            raise
+
+# Закрытие соединений с MongoDB
+async def close_mongo():
+    if client is None:
+        return
+    if MONGO_DRIVER == "sync":
+        await run_in_threadpool(client.close)
+    else:
+        await client.close()
+
+# Проверка доступности MongoDB
+async def ping_mongo():
+    if db is None:
+        return False
+    try:
+        await db.command("ping")
+        return True
+    except Exception as e:
+        logger.warning(f"MongoDB ping failed: {str(e)}")
+        return False
+
+# Проверка работы процесса (liveness): отвечает 200, пока процесс обслуживает запросы
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok", "mongo": "ok" if await ping_mongo() else "unavailable", "pid": os.getpid()}
+
+# Готовность принимать запросы (readiness): 503, пока MongoDB недоступна
+@app.get("/readyz")
+async def readyz():
+    if await ping_mongo():
+        return {"status": "ready"}
+    return MongoJSONResponse({"status": "not ready", "mongo": "unavailable"}, status_code=503)
+
+#НАСТРОЙКИ ПАГИНАЦИИ
+# Размер страницы по умолчанию и максимальный размер страницы для списковых эндпоинтов
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+#НАСТРОЙКИ КЭШИРОВАНИЯ
+# Время жизни кэша статистики в секундах (0 - кэш отключен)
+STATISTICS_CACHE_TTL = float(os.getenv("STATISTICS_CACHE_TTL", "30"))
 
 #МОДЕЛИ ДАННЫХ
 
@@ -134,500 +356,2816 @@ class Comment(BaseModel):
     created_at: datetime = Field(default_factory=datetime.now)  # Дата создания
     is_approved: bool = False  # Флаг одобрения комментария модератором
 
+# Модель действия модерации для пакетной обработки комментариев
+class ModerationAction(BaseModel):
+    comment_id: str  # ID комментария
+    action: Literal["approve", "unapprove", "delete"]  # Одобрить, вернуть на модерацию или удалить
+
 #ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ
 
-# Функция для рекурсивного преобразования ObjectId в строки
-def to_str(data):
-    if isinstance(data, list):
-        return [to_str(item) for item in data]
-    if isinstance(data, dict):
-        return {k: str(v) if isinstance(v, ObjectId) else to_str(v) for k, v in data.items()}
-    return data
+# Преобразование ID из строки в ObjectId (некорректные значения остаются как есть)
+def to_object_id(value):
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return value
 
-#API ЭНДПОИНТЫ
-#ЭНДПОИНТЫ ДЛЯ РАБОТЫ С АВТОРАМИ
+# Условие поиска по ссылочному полю: совпадение и с ObjectId, и со строкой
+# (документы, не обработанные фоновой миграцией ссылок, хранят ID строкой)
+def ref_filter(value):
+    object_id = to_object_id(value)
+    if isinstance(object_id, ObjectId):
+        return {"$in": [object_id, str(object_id)]}
+    return value
 
-# Создание нового автора
-@app.post("/authors/")
-def create_author(author: Author):
-    # Проверка на существующего автора
-    existing_author = db.authors.find_one({
-        "full_name": author.full_name,
-        "email": author.email
-    })
+# Пакетное получение документов по набору ID (один запрос с $in вместо find_one на каждый ID).
+# Не найденные документы ищутся в archive (вторым запросом, только если такие есть)
+async def fetch_docs_by_ids(collection, ids, projection, archive=None):
+    object_ids = [ObjectId(i) for i in {str(i) for i in ids if i} if ObjectId.is_valid(i)]
+    if not object_ids:
+        return {}
     
-    if existing_author:
-        return {"error": "Author already exists", "id": str(existing_author["_id"])}
+    docs = await collection.find({"_id": {"$in": object_ids}}, projection).to_list()
+    found = {str(doc["_id"]): doc for doc in docs}
     
-    # Вставка нового автора в коллекцию
-    result = db.authors.insert_one(author.dict())
-    return {"id": str(result.inserted_id)}
+    missing = [object_id for object_id in object_ids if str(object_id) not in found]
+    if archive is not None and missing:
+        docs = await archive.find({"_id": {"$in": missing}}, projection).to_list()
+        found.update({str(doc["_id"]): doc for doc in docs})
+    return found
 
-# Получение списка всех авторов
-@app.get("/authors/")
-def get_authors():
-    authors = list(db.authors.find())
-    return to_str(authors)
+# Пакетное получение значения поля по набору ID
+async def fetch_field_by_ids(collection, ids, field, archive=None):
+    docs = await fetch_docs_by_ids(collection, ids, {field: 1}, archive)
+    return {key: doc.get(field) for key, doc in docs.items()}
 
-#ЭНДПОИНТЫ ДЛЯ РАБОТЫ С КАТЕГОРИЯМИ
+#КЭШ РЕЗУЛЬТАТОВ
 
-# Создание новой категории
-@app.post("/categories/")
-def create_category(category: Category):
-    # Проверка на существующую категорию
-    existing_category = db.categories.find_one({
-        "name": category.name
-    })
+# Потокобезопасный кэш в памяти процесса с ограниченным временем жизни записей
+class TTLCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.generation = 0  # Увеличивается при каждой инвалидации
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._lock = threading.Lock()
     
-    if existing_category:
-        return {"error": "Category already exists", "id": str(existing_category["_id"])}
+    # Получение значения (None, если записи нет или она устарела)
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] <= time.monotonic():
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return item[1]
     
-    result = db.categories.insert_one(category.dict())
-    return {"id": str(result.inserted_id)}
+    # Сохранение значения; generation - поколение кэша на момент начала вычисления.
+    # Если кэш успели инвалидировать во время вычисления, результат не сохраняется.
+    def set(self, key, value, generation):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if generation == self.generation:
+                self._data[key] = (time.monotonic() + self.ttl, value)
+    
+    # Инвалидация всех записей
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+    
+    # Метрики кэша
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else None
+            }
 
-# Получение списка всех категорий
-@app.get("/categories/")
-def get_categories():
-    categories = list(db.categories.find())
-    return to_str(categories)
+# Кэш общей статистики (сбрасывается при записи статей, комментариев, авторов и категорий)
+statistics_cache = TTLCache(STATISTICS_CACHE_TTL)
 
-#ЭНДПОИНТЫ ДЛЯ РАБОТЫ СО СТАТЬЯМИ
+# Объединение одинаковых одновременных вычислений (single-flight): пока вычисление по ключу
+# выполняется, остальные запросы с тем же ключом ждут его результат (или его исключение),
+# а не запускают собственное. Вычисление идет отдельной задачей, поэтому обрыв соединения
+# первого клиента не отменяет его для остальных. Результаты не кэшируются.
+class SingleFlight:
+    def __init__(self):
+        self.computations = 0  # Запущено вычислений
+        self.shared = 0        # Запросов, получивших результат чужого вычисления
+        self._tasks = {}
+    
+    # Результат compute(*args) для ключа key
+    async def run(self, key, compute, *args):
+        task = self._tasks.get(key)
+        if task is None:
+            self.computations += 1
+            task = asyncio.ensure_future(compute(*args))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+    
+    # Снятие завершенного вычисления; исключение помечается полученным, даже если
+    # все ожидавшие запросы уже отменены
+    def _finish(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()
+    
+    # Метрики
+    def stats(self):
+        return {"in_flight": len(self._tasks), "computations": self.computations, "shared": self.shared}
 
-# Создание новой статьи
-@app.post("/articles/")
-def create_article(article: Article):
-    # Проверка на существующую статью
-    existing_article = db.articles.find_one({
-        "title": article.title,
-        "author_id": article.author_id
-    })
+# Объединение запросов к дорогим аналитическим эндпоинтам
+analytics_flight = SingleFlight()
+
+#УСЛОВНЫЕ GET-ЗАПРОСЫ (ETag / Last-Modified)
+# Каждая запись увеличивает версию измененных коллекций (коллекция collection_versions).
+# ETag ответа вычисляется из адреса запроса и версий коллекций, от которых зависит ответ,
+# поэтому на If-None-Match с тем же ETag сервер отвечает 304 по одному запросу к
+# collection_versions, не выполняя основной запрос и сериализацию.
+
+# Эндпоинты с условными запросами: (путь, коллекции, от которых зависит ответ).
+# Имена авторов и категорий хранятся в статьях, а их обновление увеличивает версию
+# articles, поэтому ответы со статьями зависят только от articles
+CONDITIONAL_ROUTES = [
+    (re.compile(r"/articles/[^/]*"), ("articles",)),
+    (re.compile(r"/authors/"), ("authors",)),
+    (re.compile(r"/categories/"), ("categories",)),
+    (re.compile(r"/comments/"), ("comments", "articles")),
+    (re.compile(r"/comments/moderation-queue"), ("comments", "articles")),
+    (re.compile(r"/content-management/"), ("articles",)),
+    (re.compile(r"/statistics/"), ("articles", "comments", "authors", "categories")),
+    (re.compile(r"/author-activity/"), ("authors", "articles", "comments")),
+    (re.compile(r"/analytics/timeseries"), ("articles", "comments")),
+    (re.compile(r"/search/"), ("articles", "comments")),
+    (re.compile(r"/content-management/export"), ("articles",)),
+    (re.compile(r"/comments/export"), ("comments", "articles")),
+    (re.compile(r"/bootstrap"), ("articles", "comments", "authors", "categories")),
+]
+
+# Эндпоинты, ответ которых зависит и от текущей даты (диапазон по умолчанию заканчивается
+# сегодня): ETag и Last-Modified меняются с началом нового дня
+DATE_DEPENDENT_ROUTES = [
+    re.compile(r"/analytics/timeseries"),
+]
+
+# Кэши процесса и коллекции, от которых они зависят
+LOCAL_CACHE_DEPENDENCIES = [
+    (statistics_cache, ("articles", "comments", "authors", "categories")),
+]
+
+# Версии коллекций, которые видел этот процесс
+seen_versions = {}
+
+# Сброс кэшей процесса, если коллекции изменил другой процесс (воркер).
+# Версии читаются при каждом условном запросе, поэтому кэши воркеров согласованы
+# с точностью до одного запроса, а не до истечения TTL.
+def sync_local_caches(versions):
+    changed = {name for name, version in versions.items() if seen_versions.get(name) != version}
+    if not changed:
+        return
+    seen_versions.update(versions)
+    for cache, collections in LOCAL_CACHE_DEPENDENCIES:
+        if changed.intersection(collections):
+            cache.clear()
+
+# Коллекции, от которых зависит ответ на запрос (None - условные запросы не поддерживаются)
+def conditional_collections(request):
+    if request.method != "GET":
+        return None
+    for pattern, collections in CONDITIONAL_ROUTES:
+        if pattern.fullmatch(request.url.path):
+            return collections
+    return None
+
+# Отметка об изменении коллекций: новая версия для ETag и сброс кэшей, зависящих от них
+async def collections_changed(*collections):
+    statistics_cache.clear()
     
-    if existing_article:
-        return {"error": "Article with this title by this author already exists", "id": str(existing_article["_id"])}
+    await db.collection_versions.bulk_write([
+        UpdateOne({"_id": name}, {"$inc": {"version": 1}, "$currentDate": {"updated_at": True}}, upsert=True)
+        for name in collections
+    ], ordered=False)
+
+# ETag и время последнего изменения для набора коллекций
+async def collections_validators(request, collections):
+    # Коллекция collection_versions содержит по документу на коллекцию - читается целиком
+    docs = await db.collection_versions.find({}).to_list()
+    sync_local_caches({doc["_id"]: doc.get("version", 0) for doc in docs})
+    versions = {doc["_id"]: doc for doc in docs if doc["_id"] in collections}
     
-    article_dict = article.dict()
-    # Устанавливаем дату публикации только если статус "Опубликовано"
-    if article.status == ArticleStatus.PUBLISHED:
-        article_dict["published_at"] = datetime.now()
-    else:
-        article_dict["published_at"] = None
+    parts = [app.version, request.url.path, request.url.query] + [str(versions.get(name, {}).get("version", 0)) for name in collections]
+    modified = [doc["updated_at"].replace(tzinfo=timezone.utc) for doc in versions.values() if doc.get("updated_at")]
+    if any(pattern.fullmatch(request.url.path) for pattern in DATE_DEPENDENT_ROUTES):
+        today = date.today()
+        parts.append(today.isoformat())
+        modified.append(datetime(today.year, today.month, today.day).astimezone(timezone.utc))
     
-    result = db.articles.insert_one(article_dict)
-    return {"id": str(result.inserted_id)}
+    key = "|".join(parts)
+    etag = f'W/"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}"'
+    last_modified = max(modified).replace(microsecond=0) if modified else None
+    return etag, last_modified
 
-# Частичное обновление статьи (только статус)
-@app.put("/articles/{article_id}")
-def update_article(article_id: str, article_data: dict):
+# Совпадает ли сохраненная у клиента копия с текущей версией ответа
+def not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+# Обработка условных GET-запросов для эндпоинтов чтения
+@app.middleware("http")
+async def conditional_get(request: Request, call_next):
+    collections = conditional_collections(request)
+    if collections is None:
+        return await call_next(request)
+    
     try:
-        # Проверяем, существует ли статья
-        existing_article = db.articles.find_one({"_id": ObjectId(article_id)})
-        if not existing_article:
-            return {"error": "Article not found"}
-        
-        # Обновляем только указанные поля
-        update_data = {}
-        
-        if "status" in article_data:
-            update_data["status"] = article_data["status"]
-            update_data["updated_at"] = datetime.now()
-            
-            # Если статус меняется на "Опубликовано", устанавливаем дату публикации
-            if article_data["status"] == "Опубликовано" and not existing_article.get("published_at"):
-                update_data["published_at"] = datetime.now()
-        
-        # Выполняем обновление в MongoDB
-        result = db.articles.update_one(
-            {"_id": ObjectId(article_id)},
-            {"$set": update_data}
-        )
-        
-        return {"success": True, "modified_count": result.modified_count}
-        
+        etag, last_modified = await collections_validators(request, collections)
     except Exception as e:
-        logger.error(f"Error updating article {article_id}: {str(e)}")
-        return {"error": str(e)}
+        logger.error(f"Failed to read collection versions: {str(e)}")
+        return await call_next(request)
+    
+    # Версии читаются до выполнения запроса: если запись произойдет во время запроса,
+    # ETag окажется старше данных и следующий запрос просто получит ответ заново
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    
+    response = await call_next(request)
+    if response.status_code == 200 and "no-store" not in response.headers.get("cache-control", ""):
+        # ETag, выставленный эндпоинтом (например, версия статьи), не заменяется
+        for name, value in headers.items():
+            response.headers.setdefault(name, value)
+    return response
 
-# Полное обновление статьи (все поля)
-@app.put("/articles/{article_id}/full")
-def update_article_full(article_id: str, article_data: dict):
-    try:
-        # Проверяем, существует ли статья
-        existing_article = db.articles.find_one({"_id": ObjectId(article_id)})
-        if not existing_article:
-            return {"error": "Article not found"}
-        
-        # Подготовка данных для обновления
-        update_data = {}
+#ОГРАНИЧЕНИЕ ЧАСТОТЫ ЗАПИСИ
+# Token bucket: у каждого клиента есть запас из burst запросов, который пополняется со
+# скоростью rate запросов в секунду. Запросы сверх запаса получают 429 с Retry-After до
+# обращения к базе, поэтому поток записей (например, спам комментариями) не отнимает
+# ресурсы MongoDB у чтения. Счетчики хранятся в памяти процесса: при нескольких воркерах
+# предел действует в каждом воркере отдельно.
+
+# Предел записей (POST, PUT, PATCH, DELETE) с одного IP в секунду и запас (0 - без предела)
+WRITE_RATE_LIMIT = float(os.getenv("WRITE_RATE_LIMIT", "0"))
+WRITE_RATE_BURST = int(os.getenv("WRITE_RATE_BURST", "50"))
+
+# Предел новых комментариев от одного автора (author_name) в секунду и запас (0 - без предела)
+COMMENT_RATE_LIMIT = float(os.getenv("COMMENT_RATE_LIMIT", "0"))
+COMMENT_RATE_BURST = int(os.getenv("COMMENT_RATE_BURST", "5"))
+
+# Максимальное число клиентов, для которых хранится состояние (самые давние вытесняются)
+RATE_LIMIT_MAX_KEYS = 100000
+
+# Методы, на которые действует предел записей
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Потокобезопасный набор token bucket по ключу клиента (LRU по времени последнего запроса)
+class RateLimiter:
+    def __init__(self, rate, burst, maxsize=RATE_LIMIT_MAX_KEYS):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.maxsize = maxsize
+        self.rejected = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+    
+    # Списание одного запроса: 0, если запрос разрешен, иначе время (в секундах) до
+    # появления свободного места
+    def acquire(self, key):
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                self.rejected += 1
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+write_limiter = RateLimiter(WRITE_RATE_LIMIT, WRITE_RATE_BURST)
+comment_author_limiter = RateLimiter(COMMENT_RATE_LIMIT, COMMENT_RATE_BURST)
+
+# Заголовки ответа 429 (Retry-After - целое число секунд)
+def retry_after_headers(wait):
+    return {"Retry-After": str(max(1, int(wait + 0.999)))}
+
+# Предел записей с одного IP (адрес клиента; за прокси uvicorn берет его из X-Forwarded-For
+# при запуске с --proxy-headers)
+@app.middleware("http")
+async def limit_writes(request: Request, call_next):
+    if request.method in WRITE_METHODS:
+        wait = write_limiter.acquire(request.client.host if request.client else "unknown")
+        if wait:
+            return JSONResponse({"detail": "Too many requests"}, status_code=429, headers=retry_after_headers(wait))
+    return await call_next(request)
+
+#МЕТРИКИ
+# Метрики в текстовом формате Prometheus: длительность HTTP-запросов по маршрутам,
+# число и длительность команд MongoDB по маршрутам (pymongo CommandListener),
+# состояние пула соединений и попадания в кэши. Маршрут текущего запроса передается
+# слушателю команд через contextvar.
+
+# Границы корзин гистограммы длительности HTTP-запросов (в секундах)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Число команд MongoDB за один HTTP-запрос, после которого в лог пишется предупреждение (N+1)
+QUERY_WARN_THRESHOLD = int(os.getenv("QUERY_WARN_THRESHOLD", "10"))
+
+# Маршрут и число команд MongoDB текущего HTTP-запроса
+current_request = contextvars.ContextVar("current_request", default=None)
+
+# Экранирование значения метки
+def label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Строка метрики с метками. Счетчики хранятся в памяти процесса, поэтому каждая строка
+# помечается PID воркера (метка worker): запрос /metrics попадает в случайный воркер, и без
+# метки значения разных процессов чередовались бы в одном ряду
+def metric_line(name, labels, value):
+    rendered = ",".join(f'{key}="{label_value(val)}"' for key, val in {**labels, "worker": os.getpid()}.items())
+    return f"{name}{{{rendered}}} {value}"
+
+# Потокобезопасный реестр метрик процесса
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}  # (method, route, status) -> [корзины..., сумма, количество]
+        self.commands = {}  # (route, command) -> [количество, ошибки, суммарная длительность]
+        self.connections = 0  # Открытые соединения пула
+        self.checked_out = 0  # Соединения, занятые запросами
+        self.checkout_failures = 0
+        self.slow_requests = {}  # route -> число запросов с превышением QUERY_WARN_THRESHOLD
+    
+    def observe_request(self, method, route, status, duration):
+        with self._lock:
+            item = self.requests.setdefault((method, route, status), [0] * (len(LATENCY_BUCKETS) + 2))
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    item[index] += 1
+            item[-2] += duration
+            item[-1] += 1
+    
+    def observe_command(self, route, command, duration, failed):
+        with self._lock:
+            item = self.commands.setdefault((route, command), [0, 0, 0.0])
+            item[0] += 1
+            item[1] += int(failed)
+            item[2] += duration
+    
+    def observe_query_threshold(self, route):
+        with self._lock:
+            self.slow_requests[route] = self.slow_requests.get(route, 0) + 1
+    
+    def change_pool(self, connections=0, checked_out=0, checkout_failures=0):
+        with self._lock:
+            self.connections += connections
+            self.checked_out += checked_out
+            self.checkout_failures += checkout_failures
+    
+    # Все метрики в текстовом формате Prometheus
+    def render(self, caches, limiters=None):
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP blog_http_request_duration_seconds HTTP request latency by route.",
+                "# TYPE blog_http_request_duration_seconds histogram"
+            ]
+            for (method, route, status), item in sorted(self.requests.items()):
+                labels = {"method": method, "route": route, "status": status}
+                for index, bound in enumerate(LATENCY_BUCKETS):
+                    lines.append(metric_line("blog_http_request_duration_seconds_bucket", {**labels, "le": bound}, item[index]))
+                lines.append(metric_line("blog_http_request_duration_seconds_bucket", {**labels, "le": "+Inf"}, item[-1]))
+                lines.append(metric_line("blog_http_request_duration_seconds_sum", labels, item[-2]))
+                lines.append(metric_line("blog_http_request_duration_seconds_count", labels, item[-1]))
+            
+            lines += [
+                "# HELP blog_mongo_commands_total MongoDB commands by route and command name.",
+                "# TYPE blog_mongo_commands_total counter"
+            ]
+            for (route, command), item in sorted(self.commands.items()):
+                lines.append(metric_line("blog_mongo_commands_total", {"route": route, "command": command}, item[0]))
+            lines += [
+                "# HELP blog_mongo_command_failures_total Failed MongoDB commands by route and command name.",
+                "# TYPE blog_mongo_command_failures_total counter"
+            ]
+            for (route, command), item in sorted(self.commands.items()):
+                lines.append(metric_line("blog_mongo_command_failures_total", {"route": route, "command": command}, item[1]))
+            lines += [
+                "# HELP blog_mongo_command_duration_seconds_total Total MongoDB command time by route and command name.",
+                "# TYPE blog_mongo_command_duration_seconds_total counter"
+            ]
+            for (route, command), item in sorted(self.commands.items()):
+                lines.append(metric_line("blog_mongo_command_duration_seconds_total", {"route": route, "command": command}, item[2]))
+            
+            lines += [
+                f"# HELP blog_http_requests_over_query_threshold_total Requests that made more than {QUERY_WARN_THRESHOLD} MongoDB commands.",
+                "# TYPE blog_http_requests_over_query_threshold_total counter"
+            ]
+            for route, count in sorted(self.slow_requests.items()):
+                lines.append(metric_line("blog_http_requests_over_query_threshold_total", {"route": route}, count))
+            
+            lines += [
+                "# HELP blog_mongo_pool_connections Open connections in the MongoDB pool.",
+                "# TYPE blog_mongo_pool_connections gauge",
+                metric_line("blog_mongo_pool_connections", {}, self.connections),
+                "# HELP blog_mongo_pool_checked_out Connections currently checked out of the MongoDB pool.",
+                "# TYPE blog_mongo_pool_checked_out gauge",
+                metric_line("blog_mongo_pool_checked_out", {}, self.checked_out),
+                "# HELP blog_mongo_pool_max_size Maximum size of the MongoDB pool.",
+                "# TYPE blog_mongo_pool_max_size gauge",
+                metric_line("blog_mongo_pool_max_size", {}, MONGO_MAX_POOL_SIZE),
+                "# HELP blog_mongo_pool_checkout_failures_total Failed connection checkouts.",
+                "# TYPE blog_mongo_pool_checkout_failures_total counter",
+                metric_line("blog_mongo_pool_checkout_failures_total", {}, self.checkout_failures)
+            ]
         
-        # Обновляем только переданные поля (кроме _id)
-        allowed_fields = ['title', 'content', 'author_id', 'category_id', 'status']
-        for field in allowed_fields:
-            if field in article_data:
-                update_data[field] = article_data[field]
-        
-        # Обновляем дату изменения
-        update_data["updated_at"] = datetime.now()
-        
-        # Обработка даты публикации в зависимости от статуса
-        if 'status' in update_data and update_data['status'] == "Опубликовано":
-            if not existing_article.get("published_at"):
-                update_data["published_at"] = datetime.now()
-        elif 'status' in update_data and existing_article.get("status") == "Опубликовано":
-            update_data["published_at"] = None
-        
-        # Выполняем обновление
-        result = db.articles.update_one(
-            {"_id": ObjectId(article_id)},
-            {"$set": update_data}
-        )
+        for name, help_text, kind in (
+            ("blog_cache_hits_total", "Cache hits.", "counter"),
+            ("blog_cache_misses_total", "Cache misses.", "counter"),
+            ("blog_cache_hit_ratio", "Share of cache lookups served from the cache.", "gauge")
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for cache_name, cache in caches.items():
+                total = cache.hits + cache.misses
+                value = {
+                    "blog_cache_hits_total": cache.hits,
+                    "blog_cache_misses_total": cache.misses,
+                    "blog_cache_hit_ratio": cache.hits / total if total else 0
+                }[name]
+                lines.append(metric_line(name, {"cache": cache_name}, value))
         
-        return {"success": True, "modified_count": result.modified_count}
+        if limiters:
+            lines += [
+                "# HELP blog_rate_limited_total Requests rejected with 429 by rate limiter.",
+                "# TYPE blog_rate_limited_total counter"
+            ]
+            for limiter_name, limiter in limiters.items():
+                lines.append(metric_line("blog_rate_limited_total", {"limiter": limiter_name}, limiter.rejected))
         
-    except Exception as e:
-        logger.error(f"Error updating article {article_id}: {str(e)}")
-        return {"error": str(e)}
+        return "\n".join(lines) + "\n"
 
-# Получение списка статей с фильтрацией
-@app.get("/articles/")
-def get_articles(
-    status: Optional[ArticleStatus] = Query(None),  # Фильтр по статусу
-    author_id: Optional[str] = Query(None),         # Фильтр по автору
-    category_id: Optional[str] = Query(None)        # Фильтр по категории
-):
-    query = {}
+metrics = Metrics()
+
+# Учет команд MongoDB по маршруту текущего HTTP-запроса
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        context = current_request.get()
+        if context is not None:
+            context["commands"] += 1
     
-    if status:
-        query["status"] = status.value
+    def succeeded(self, event):
+        context = current_request.get()
+        metrics.observe_command(context["route"] if context else "background", event.command_name, event.duration_micros / 1e6, False)
     
-    if author_id:
-        query["author_id"] = author_id
+    def failed(self, event):
+        context = current_request.get()
+        metrics.observe_command(context["route"] if context else "background", event.command_name, event.duration_micros / 1e6, True)
+
+# Учет открытых и занятых соединений пула MongoDB
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    def pool_created(self, event):
+        pass
     
-    if category_id:
-        query["category_id"] = category_id
+    def pool_ready(self, event):
+        pass
     
-    # Получаем статьи с сортировкой по дате создания (новые первыми)
-    articles = list(db.articles.find(query).sort("created_at", -1))
+    def pool_cleared(self, event):
+        pass
     
-    # Добавляем информацию об авторе и категории 
-    for article in articles:
-        # Получаем автора
-        author = db.authors.find_one({"_id": ObjectId(article["author_id"])})
-        article["author_name"] = author["full_name"] if author else "Неизвестно"
-        
-        # Получаем категорию
-        category = db.categories.find_one({"_id": ObjectId(article["category_id"])})
-        article["category_name"] = category["name"] if category else "Неизвестно"
+    def pool_closed(self, event):
+        pass
     
-    return to_str(articles)
-
-# Получение конкретной статьи по ID
-@app.get("/articles/{article_id}")
-def get_article(article_id: str):
-    article = db.articles.find_one({"_id": ObjectId(article_id)})
-    if not article:
-        return {"error": "Article not found"}
+    def connection_created(self, event):
+        metrics.change_pool(connections=1)
     
-    # Добавляем информацию об авторе и категории
-    author = db.authors.find_one({"_id": ObjectId(article["author_id"])})
-    article["author_name"] = author["full_name"] if author else "Неизвестно"
+    def connection_ready(self, event):
+        pass
     
-    category = db.categories.find_one({"_id": ObjectId(article["category_id"])})
-    article["category_name"] = category["name"] if category else "Неизвестно"
+    def connection_closed(self, event):
+        metrics.change_pool(connections=-1)
     
-    return to_str(article)
-
-#ЭНДПОИНТЫ ДЛЯ РАБОТЫ С КОММЕНТАРИЯМИ
-# Создание нового комментария
-@app.post("/comments/")
-def create_comment(comment: Comment):
-    # Проверка на существующий комментарий
-    existing_comment = db.comments.find_one({
-        "article_id": comment.article_id,
-        "author_name": comment.author_name,
-        "content": comment.content
-    })
+    def connection_check_out_started(self, event):
+        pass
     
-    if existing_comment:
-        return {"error": "Similar comment already exists", "id": str(existing_comment["_id"])}
+    def connection_check_out_failed(self, event):
+        metrics.change_pool(checkout_failures=1)
     
-    result = db.comments.insert_one(comment.dict())
-    return {"id": str(result.inserted_id)}
+    def connection_checked_out(self, event):
+        metrics.change_pool(checked_out=1)
+    
+    def connection_checked_in(self, event):
+        metrics.change_pool(checked_out=-1)
 
-# Одобрение комментария
-@app.put("/comments/{comment_id}/approve")
-def approve_comment(comment_id: str):
-    result = db.comments.update_one(
-        {"_id": ObjectId(comment_id)},
-        {"$set": {"is_approved": True}}
-    )
-    return {"modified_count": result.modified_count}
+# Шаблон маршрута запроса (метка метрик не зависит от ID в пути)
+def route_template(request):
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
 
-# Отмена одобрения комментария
-@app.put("/comments/{comment_id}/unapprove")
-def unapprove_comment(comment_id: str):
-    result = db.comments.update_one(
-        {"_id": ObjectId(comment_id)},
-        {"$set": {"is_approved": False}}
+# Длительность HTTP-запросов и число команд MongoDB на запрос
+@app.middleware("http")
+async def collect_metrics(request: Request, call_next):
+    context = {"route": route_template(request), "commands": 0}
+    token = current_request.set(context)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        current_request.reset(token)
+        metrics.observe_request(request.method, context["route"], status, time.perf_counter() - start)
+        if context["commands"] > QUERY_WARN_THRESHOLD:
+            metrics.observe_query_threshold(context["route"])
+            logger.warning(f"{request.method} {context['route']} made {context['commands']} MongoDB commands (threshold {QUERY_WARN_THRESHOLD})")
+
+# Метрики в формате Prometheus
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(
+        metrics.render({
+            "statistics": statistics_cache
+        }, {
+            "writes": write_limiter,
+            "comment_authors": comment_author_limiter
+        }),
+        media_type="text/plain; version=0.0.4"
     )
-    return {"modified_count": result.modified_count}
 
-# Получение комментариев с фильтрацией
-@app.get("/comments/")
-def get_comments(
-    article_id: Optional[str] = Query(None),  # Фильтр по статье
-    is_approved: Optional[bool] = Query(None) # Фильтр по статусу одобрения
-):
-    query = {}
+#НАСТРОЙКА CORS
+# Настройка политики CORS для взаимодействия с frontend приложениями.
+# Регистрируется после остальных middleware, чтобы быть внешним: их ответы (429 ограничения
+# записи, 304 условных запросов) тоже получают заголовки CORS и доступны браузеру
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:8080", "http://localhost:3000"],  # Разрешенные домены
+    allow_credentials=True,
+    allow_methods=["*"],  # Разрешить все HTTP методы
+    allow_headers=["*"],  # Разрешить все заголовки
+    expose_headers=["X-Next-Cursor", "X-Pending-Count", "Retry-After"],  # Курсор следующей страницы, размер очереди модерации и задержка после 429 доступны JavaScript
+)
+
+#ПАГИНАЦИЯ И ПРОЕКЦИЯ
+
+# Кодирование курсора: значения полей сортировки последнего документа страницы
+def encode_cursor(doc, sort):
+    values = []
+    for field, _ in sort:
+        value = doc.get(field)
+        if isinstance(value, ObjectId):
+            values.append({"oid": str(value)})
+        elif isinstance(value, datetime):
+            values.append({"dt": value.isoformat()})
+        else:
+            values.append(value)
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+# Декодирование курсора обратно в значения полей сортировки
+def decode_cursor(cursor, sort):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    if article_id:
-        query["article_id"] = article_id
+    decoded = []
+    try:
+        for value in values:
+            if isinstance(value, dict) and "oid" in value:
+                decoded.append(ObjectId(value["oid"]))
+            elif isinstance(value, dict) and "dt" in value:
+                decoded.append(datetime.fromisoformat(value["dt"]))
+            else:
+                decoded.append(value)
+    except (InvalidId, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return decoded
+
+# Условие keyset-пагинации: документы строго после курсора в порядке сортировки
+def keyset_condition(sort, values):
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        branch = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort[:i])}
+        branch[field] = {"$lt" if direction < 0 else "$gt": values[i]}
+        branches.append(branch)
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+# Построение проекции из параметра fields (через запятую); required - поля, нужные самому эндпоинту
+def build_projection(fields, required=()):
+    if not fields:
+        return None
     
-    if is_approved is not None:
-        query["is_approved"] = is_approved
+    projection = {name.strip(): 1 for name in fields.split(",") if name.strip() and not name.strip().startswith("$")}
+    projection.update({name: 1 for name in required})
+    return projection
+
+# Проверка, запрошено ли поле (без fields возвращаются все поля)
+def field_requested(fields, name):
+    return not fields or name in [f.strip() for f in fields.split(",")]
+
+# Получение одной страницы коллекции: (документы, курсор следующей страницы или None).
+# С archive страница собирается из двух коллекций: из каждой читается limit + 1 документов
+# после курсора, результаты сливаются по ключу сортировки (поля сортировки эндпоинтов
+# имеют одно направление)
+async def fetch_page(collection, query, sort, limit, after=None, projection=None, archive=None):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
     
-    comments = list(db.comments.find(query).sort("created_at", -1))
+    if after:
+        query = {"$and": [query, keyset_condition(sort, decode_cursor(after, sort))]}
     
-    # Добавляем информацию о статье для каждого комментария
-    for comment in comments:
-        article = db.articles.find_one({"_id": ObjectId(comment["article_id"])})
-        comment["article_title"] = article["title"] if article else "Неизвестно"
+    docs = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list()
+    if archive is not None:
+        docs += await archive.find(query, projection).sort(sort).limit(limit + 1).to_list()
+        docs.sort(key=lambda doc: [doc.get(field) for field, _ in sort], reverse=sort[0][1] < 0)
     
-    return to_str(comments)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort)
+    
+    return docs, next_cursor
 
-# Удаление комментария
-@app.delete("/comments/{comment_id}")
-def delete_comment(comment_id: str):
-    try:
-        # Проверяем, существует ли комментарий
-        comment = db.comments.find_one({"_id": ObjectId(comment_id)})
-        if not comment:
-            return {"error": "Comment not found", "deleted_count": 0}
-        
-        # Удаляем комментарий
-        result = db.comments.delete_one({"_id": ObjectId(comment_id)})
-        
-        if result.deleted_count > 0:
-            return {"success": True, "deleted_count": result.deleted_count}
-        else:
-            return {"error": "Failed to delete comment", "deleted_count": 0}
-            
-    except Exception as e:
-        logger.error(f"Error deleting comment {comment_id}: {str(e)}")
-        return {"error": str(e), "deleted_count": 0}
+# Ответ со страницей документов; курсор следующей страницы передается в заголовке X-Next-Cursor
+def page_response(docs, next_cursor):
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return MongoJSONResponse(docs, headers=headers)
 
-#СВОДНЫЕ ТАБЛИЦЫ (АНАЛИТИКА)
+#ВИТРИНА АКТИВНОСТИ АВТОРОВ
+# Коллекция author_activity хранит по документу на автора (_id - ID автора строкой)
+# с готовыми счетчиками; эндпоинты записи обновляют счетчики инкрементально.
 
-# 1. Управление контентом: список статей с расширенной информацией
-@app.get("/content-management/")
-def get_content_management():
-    try:
-        articles = list(db.articles.find())
-        
-        result = []
-        for article in articles:
-            # Получаем автора
-            author = None
-            if "author_id" in article:
-                try:
-                    author = db.authors.find_one({"_id": ObjectId(article["author_id"])})
-                except:
-                    author = None
-            
-            # Получаем категорию
-            category = None
-            if "category_id" in article:
-                try:
-                    category = db.categories.find_one({"_id": ObjectId(article["category_id"])})
-                except:
-                    category = None
-            
-            # Формируем запись для таблицы управления контентом
-            result.append({
-                "_id": str(article.get("_id", "")),
-                "title": article.get("title", "Без названия"),
-                "author_name": author.get("full_name", "Неизвестно") if author else "Неизвестно",
-                "category_name": category.get("name", "Без категории") if category else "Без категории",
-                "status": article.get("status", "Не указан"),
-                "created_at": article.get("created_at"),
-                "published_at": article.get("published_at")
-            })
-        
-        return result
-        
-    except Exception as e:
-        logger.error(f"Error in content-management: {str(e)}")
-        return {"error": str(e)}
+# Создание записи витрины для нового автора
+async def init_author_activity(author_id, author):
+    await db.author_activity.replace_one({"_id": str(author_id)}, {
+        "author_name": author["full_name"],
+        "published_articles_count": 0,
+        "total_comments_count": 0,
+        "email": author.get("email", ""),
+        "registration_date": author.get("registration_date")
+    }, upsert=True)
 
-# 2. Активность авторов: статистика по каждому автору
-@app.get("/author-activity/")
-def get_author_activity():
-    try:
-        # Агрегационный запрос для подсчета опубликованных статей
-        articles_pipeline = [
-            {"$match": {"status": ArticleStatus.PUBLISHED.value}},
-            {
-                "$group": {
-                    "_id": "$author_id",
-                    "published_articles_count": {"$sum": 1}
-                }
-            }
-        ]
-        
-        # Агрегационный запрос для подсчета комментариев к статьям автора
-        comments_pipeline = [
-            {
-                "$addFields": {
-                    "article_object_id": {"$toObjectId": "$article_id"}
-                }
-            },
-            {
-                "$lookup": {
-                    "from": "articles",
-                    "localField": "article_object_id",
-                    "foreignField": "_id",
-                    "as": "article"
-                }
-            },
-            {"$unwind": "$article"},
-            {
-                "$group": {
-                    "_id": "$article.author_id",
-                    "total_comments_count": {"$sum": 1}
-                }
-            }
-        ]
+# Изменение счетчиков автора (записи для несуществующих авторов не создаются)
+async def increment_author_activity(author_id, published=0, comments=0):
+    if not author_id or (not published and not comments):
+        return
+    await db.author_activity.update_one(
+        {"_id": str(author_id)},
+        {"$inc": {"published_articles_count": published, "total_comments_count": comments}}
+    )
+
+# Изменение счетчиков нескольких авторов одним bulk_write: changes = {author_id: (published, comments)}
+async def increment_author_activity_many(changes):
+    operations = [
+        UpdateOne(
+            {"_id": str(author_id)},
+            {"$inc": {"published_articles_count": published, "total_comments_count": comments}}
+        )
+        for author_id, (published, comments) in changes.items()
+        if author_id and (published or comments)
+    ]
+    if operations:
+        await db.author_activity.bulk_write(operations, ordered=False)
+
+#АНАЛИТИКА ПО ДНЯМ
+# Коллекция analytics_daily хранит по документу на день и срез: scope "all" - весь блог,
+# "author" и "category" - отдельный автор или категория (key - ID строкой). Документ содержит
+# число статей, опубликованных в этот день, и число комментариев, полученных в этот день.
+# Эндпоинты записи обновляют счетчики инкрементально, поэтому временные ряды читаются
+# из не более чем одного документа на день без обхода articles и comments.
+
+# Срезы аналитики, которые обновляет каждое изменение
+ANALYTICS_SCOPES = ("all", "author", "category")
+
+# Максимальная длина диапазона временного ряда, дней
+ANALYTICS_MAX_RANGE_DAYS = int(os.getenv("ANALYTICS_MAX_RANGE_DAYS", "1830"))
+
+# Начало дня для даты (день в документах аналитики)
+def analytics_day(value):
+    return datetime(value.year, value.month, value.day)
+
+# Ключ среза автора или категории (ссылки хранятся как ObjectId или строкой)
+def analytics_key(value):
+    return str(value) if value else ""
+
+# Накопление изменения аналитики: changes = {(день, срез, ключ): (опубликовано, комментариев)}
+def add_analytics_change(changes, when, author_id, category_id, published=0, comments=0):
+    if when is None:
+        return
+    day = analytics_day(when)
+    for scope, key in zip(ANALYTICS_SCOPES, ("", analytics_key(author_id), analytics_key(category_id))):
+        current_published, current_comments = changes.get((day, scope, key), (0, 0))
+        changes[(day, scope, key)] = (current_published + published, current_comments + comments)
+
+# Применение накопленных изменений аналитики одним bulk_write
+async def increment_analytics(changes):
+    operations = [
+        UpdateOne(
+            {"scope": scope, "key": key, "day": day},
+            {"$inc": {"published_articles": published, "comments": comments}},
+            upsert=True
+        )
+        for (day, scope, key), (published, comments) in changes.items()
+        if published or comments
+    ]
+    if operations:
+        await db.analytics_daily.bulk_write(operations, ordered=False)
+
+# Счетчики авторов и аналитика при добавлении (sign=1) или удалении (sign=-1) комментариев.
+# Авторы и категории статей загружаются одним запросом на весь набор комментариев
+async def count_comments(comments, sign):
+    articles = await fetch_docs_by_ids(db.articles, (c.get("article_id") for c in comments), {"author_id": 1, "category_id": 1}, db.articles_archive)
+    activity = {}
+    analytics = {}
+    for comment in comments:
+        article = articles.get(str(comment.get("article_id")))
+        if article is None:
+            continue
+        if article.get("author_id"):
+            author_id = str(article["author_id"])
+            published, count = activity.get(author_id, (0, 0))
+            activity[author_id] = (published, count + sign)
+        add_analytics_change(analytics, comment.get("created_at"), article.get("author_id"), article.get("category_id"), comments=sign)
+    
+    await increment_author_activity_many(activity)
+    await increment_analytics(analytics)
+
+#ИМЕНА АВТОРОВ И КАТЕГОРИЙ В СТАТЬЯХ
+# Статьи хранят author_name и category_name рядом со ссылками, поэтому списки, поиск и
+# таблица управления контентом читаются без запросов к authors и categories. При изменении
+# имени статьи обновляются в фоне пакетами; расхождения (например, после сбоя процесса
+# во время обновления) находит и исправляет check_article_names.
+
+# Число статей, обновляемых одним запросом при изменении имени
+NAME_FANOUT_BATCH_SIZE = int(os.getenv("NAME_FANOUT_BATCH_SIZE", "1000"))
+
+# Денормализованные поля: (ссылка в статье, поле имени в статье, коллекция-источник, поле имени в источнике)
+DISPLAY_NAME_FIELDS = [
+    ("author_id", "author_name", "authors", "full_name"),
+    ("category_id", "category_name", "categories", "name"),
+]
+
+# Фоновые задачи обновления имен (ссылки держатся до завершения задачи)
+name_fanout_tasks = set()
+
+# Время ожидания незавершенных задач обновления имен при остановке сервера, с
+NAME_FANOUT_SHUTDOWN_TIMEOUT = 10
+
+# Обновление имени во всех статьях (рабочих и архивных) со ссылкой ref_id пакетами по _id.
+# Перед каждым пакетом имя перечитывается из источника: если его успели изменить еще раз,
+# следующие пакеты (и уже обновленные статьи) получают новое имя, поэтому при нескольких
+# одновременных задачах в статьях остается последнее имя
+async def propagate_name(database, ref_field, name_field, source, source_field, ref_id, batch_size=NAME_FANOUT_BATCH_SIZE):
+    updated = 0
+    for collection in (database.articles, database.articles_archive):
+        while True:
+            current = await database[source].find_one({"_id": to_object_id(ref_id)}, {source_field: 1})
+            name = current.get(source_field) if current else None
+            query = {ref_field: ref_filter(ref_id), name_field: {"$ne": name}}
+            
+            ids = [doc["_id"] for doc in await collection.find(query, {"_id": 1}).limit(batch_size).to_list()]
+            if not ids:
+                break
+            result = await collection.update_many({"_id": {"$in": ids}, name_field: {"$ne": name}}, {"$set": {name_field: name}})
+            updated += result.modified_count
+            await collections_changed("articles")
+    
+    logger.info(f"Updated {name_field} in {updated} articles for {ref_field} {ref_id}")
+    return updated
+
+# Запуск обновления имени в статьях в фоне (ответ на запрос изменения не ждет его завершения)
+def schedule_name_fanout(ref_field, ref_id):
+    for field, name_field, source, source_field in DISPLAY_NAME_FIELDS:
+        if field == ref_field:
+            task = asyncio.create_task(run_background_job(
+                f"{name_field} update", propagate_name, db, field, name_field, source, source_field, ref_id
+            ))
+            name_fanout_tasks.add(task)
+            task.add_done_callback(name_fanout_tasks.discard)
+
+# Проверка денормализованных имен во всех статьях: одна группировка на коллекцию статей,
+# сравнение с текущими именами авторов и категорий. fix=True исправляет расхождения.
+# Возвращает список расхождений
+async def check_article_names(database, fix=False):
+    mismatches = []
+    for ref_field, name_field, source, source_field in DISPLAY_NAME_FIELDS:
+        names = {str(doc["_id"]): doc.get(source_field) async for doc in database[source].find({}, {source_field: 1})}
         
-        published_articles = list(db.articles.aggregate(articles_pipeline))
-        comments_by_author = list(db.comments.aggregate(comments_pipeline))
+        for collection_name in ("articles", "articles_archive"):
+            pipeline = [{"$group": {"_id": {"ref": f"${ref_field}", "name": f"${name_field}"}, "count": {"$sum": 1}}}]
+            async for item in await database[collection_name].aggregate(pipeline):
+                ref_id = item["_id"].get("ref")
+                expected = names.get(str(ref_id)) if ref_id else None
+                stored = item["_id"].get("name")
+                if stored != expected:
+                    mismatches.append({
+                        "collection": collection_name,
+                        "field": name_field,
+                        ref_field: str(ref_id) if ref_id else None,
+                        "stored": stored,
+                        "expected": expected,
+                        "count": item["count"]
+                    })
+    
+    for mismatch in mismatches:
+        logger.warning(
+            f"{mismatch['collection']}: {mismatch['count']} articles have {mismatch['field']} "
+            f"{mismatch['stored']!r} instead of {mismatch['expected']!r}"
+        )
+    
+    if fix:
+        for ref_field, name_field, source, source_field in DISPLAY_NAME_FIELDS:
+            ref_ids = {m[ref_field] for m in mismatches if m["field"] == name_field and m.get(ref_field)}
+            for ref_id in ref_ids:
+                await propagate_name(database, ref_field, name_field, source, source_field, ref_id)
+            # Статьи без ссылки (или с пустой ссылкой) не должны хранить имя
+            for collection in (database.articles, database.articles_archive):
+                await collection.update_many({ref_field: {"$in": [None, ""]}, name_field: {"$ne": None}}, {"$set": {name_field: None}})
+    
+    logger.info(f"Article name check: {len(mismatches)} mismatches" + (" fixed" if fix and mismatches else ""))
+    return mismatches
+
+# Заполнение имен в статьях, созданных до их денормализации
+async def backfill_article_names(database):
+    await check_article_names(database, fix=True)
+
+#API ЭНДПОИНТЫ
+#ЭНДПОИНТЫ ДЛЯ РАБОТЫ С АВТОРАМИ
+
+# Создание нового автора
+@app.post("/authors/")
+async def create_author(author: Author):
+    # Вставка нового автора в коллекцию (дубликаты отсекает уникальный индекс)
+    try:
+        result = await db.authors.insert_one(author.dict())
+    except DuplicateKeyError:
+        existing_author = await db.authors.find_one({
+            "full_name": author.full_name,
+            "email": author.email
+        }, {"_id": 1})
+        return {"error": "Author already exists", "id": str(existing_author["_id"]) if existing_author else None}
+    
+    await init_author_activity(result.inserted_id, author.dict())
+    await collections_changed("authors")
+    return {"id": str(result.inserted_id)}
+
+# Получение списка авторов (постранично)
+@app.get("/authors/")
+async def get_authors(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),  # Размер страницы
+    after: Optional[str] = Query(None),                             # Курсор из заголовка X-Next-Cursor
+    fields: Optional[str] = Query(None)                             # Возвращаемые поля через запятую
+):
+    authors, next_cursor = await fetch_page(db.authors, {}, [("_id", 1)], limit, after, build_projection(fields))
+    return page_response(authors, next_cursor)
+
+# Изменение автора: имя обновляется в витрине активности сразу, в статьях - в фоне
+@app.put("/authors/{author_id}")
+async def update_author(author_id: str, author_data: dict):
+    if not ObjectId.is_valid(author_id):
+        return {"error": "Author not found"}
+    update_data = {field: author_data[field] for field in ["full_name", "email"] if field in author_data}
+    if not update_data:
+        return {"error": "Nothing to update"}
+    
+    try:
+        result = await db.authors.update_one({"_id": ObjectId(author_id)}, {"$set": update_data})
+    except DuplicateKeyError:
+        return {"error": "Author with this name and email already exists"}
+    if result.matched_count == 0:
+        return {"error": "Author not found"}
+    
+    activity = {"author_name": update_data["full_name"]} if "full_name" in update_data else {}
+    if "email" in update_data:
+        activity["email"] = update_data["email"]
+    await db.author_activity.update_one({"_id": author_id}, {"$set": activity})
+    await collections_changed("authors")
+    
+    if "full_name" in update_data and result.modified_count:
+        schedule_name_fanout("author_id", author_id)
+    return {"modified_count": result.modified_count}
+
+#ЭНДПОИНТЫ ДЛЯ РАБОТЫ С КАТЕГОРИЯМИ
+
+# Создание новой категории
+@app.post("/categories/")
+async def create_category(category: Category):
+    # Вставка новой категории (дубликаты отсекает уникальный индекс)
+    try:
+        result = await db.categories.insert_one(category.dict())
+    except DuplicateKeyError:
+        existing_category = await db.categories.find_one({
+            "name": category.name
+        }, {"_id": 1})
+        return {"error": "Category already exists", "id": str(existing_category["_id"]) if existing_category else None}
+    
+    await collections_changed("categories")
+    return {"id": str(result.inserted_id)}
+
+# Получение списка категорий (постранично)
+@app.get("/categories/")
+async def get_categories(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),  # Размер страницы
+    after: Optional[str] = Query(None),                             # Курсор из заголовка X-Next-Cursor
+    fields: Optional[str] = Query(None)                             # Возвращаемые поля через запятую
+):
+    categories, next_cursor = await fetch_page(db.categories, {}, [("_id", 1)], limit, after, build_projection(fields))
+    return page_response(categories, next_cursor)
+
+# Изменение категории: название в статьях обновляется в фоне
+@app.put("/categories/{category_id}")
+async def update_category(category_id: str, category_data: dict):
+    if not ObjectId.is_valid(category_id):
+        return {"error": "Category not found"}
+    update_data = {field: category_data[field] for field in ["name", "description"] if field in category_data}
+    if not update_data:
+        return {"error": "Nothing to update"}
+    
+    try:
+        result = await db.categories.update_one({"_id": ObjectId(category_id)}, {"$set": update_data})
+    except DuplicateKeyError:
+        return {"error": "Category already exists"}
+    if result.matched_count == 0:
+        return {"error": "Category not found"}
+    
+    await collections_changed("categories")
+    
+    if "name" in update_data and result.modified_count:
+        schedule_name_fanout("category_id", category_id)
+    return {"modified_count": result.modified_count}
+
+#ЭНДПОИНТЫ ДЛЯ РАБОТЫ СО СТАТЬЯМИ
+
+# Документ статьи для сохранения в MongoDB
+def article_document(article):
+    article_dict = article.dict()
+    # Ссылки на автора и категорию храним как ObjectId
+    article_dict["author_id"] = to_object_id(article.author_id)
+    article_dict["category_id"] = to_object_id(article.category_id)
+    # Устанавливаем дату публикации только если статус "Опубликовано"
+    if article.status == ArticleStatus.PUBLISHED:
+        article_dict["published_at"] = datetime.now()
+    else:
+        article_dict["published_at"] = None
+    article_dict["version"] = 1  # Версия для If-Match (увеличивается при каждом обновлении)
+    return article_dict
+
+# Имена автора и категории, которые хранятся в статьях, чтобы чтение обходилось без join.
+# Читаются из базы, а не из кэша процесса: кэш другого воркера может хранить старое имя
+async def attach_display_names(articles):
+    author_names = await fetch_field_by_ids(db.authors, (a.get("author_id") for a in articles), "full_name")
+    category_names = await fetch_field_by_ids(db.categories, (a.get("category_id") for a in articles), "name")
+    for article in articles:
+        article["author_name"] = author_names.get(str(article.get("author_id")))
+        article["category_name"] = category_names.get(str(article.get("category_id")))
+
+# Создание новой статьи
+@app.post("/articles/")
+async def create_article(article: Article):
+    article_dict = article_document(article)
+    await attach_display_names([article_dict])
+    
+    # Вставка статьи (дубликаты по заголовку и автору отсекает уникальный индекс)
+    try:
+        result = await db.articles.insert_one(article_dict)
+    except DuplicateKeyError:
+        existing_article = await db.articles.find_one({
+            "title": article.title,
+            "author_id": ref_filter(article.author_id)
+        }, {"_id": 1})
+        return {"error": "Article with this title by this author already exists", "id": str(existing_article["_id"]) if existing_article else None}
+    
+    if article.status == ArticleStatus.PUBLISHED:
+        await increment_author_activity(article.author_id, published=1)
+        analytics = {}
+        add_analytics_change(analytics, article_dict["published_at"], article_dict["author_id"], article_dict["category_id"], published=1)
+        await increment_analytics(analytics)
+    await collections_changed("articles")
+    return {"id": str(result.inserted_id)}
+
+# Ожидаемая версия статьи из заголовка If-Match (None, если заголовка нет)
+def parse_if_match(value):
+    if value is None:
+        return None
+    try:
+        return int(value.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must contain the article version")
+
+# Обновление статьи одним запросом find_one_and_update с pipeline-обновлением.
+# Дата публикации вычисляется на сервере по текущему значению документа: сохраняется при
+# переходе "Опубликовано" -> "Опубликовано", ставится при публикации, сбрасывается при
+# снятии с публикации. version увеличивается при каждом изменении; при переданном
+# If-Match обновление выполняется, только если версия в базе совпадает.
+async def update_article_atomically(article_id, update_data, expected_version):
+    if "status" in update_data and update_data["status"] not in {status.value for status in ArticleStatus}:
+        return {"error": f"Invalid status: {update_data['status']}"}
+    
+    now = datetime.now()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)  # Точность дат в BSON - миллисекунды
+    # Значения из запроса передаются как $literal, чтобы строки с "$" не считались выражениями
+    values = {field: {"$literal": value} for field, value in update_data.items()}
+    values["updated_at"] = now
+    values["version"] = {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+    if "status" in update_data:
+        values["published_at"] = {
+            "$cond": [{"$eq": [update_data["status"], ArticleStatus.PUBLISHED.value]}, {"$ifNull": ["$published_at", now]}, None]
+        }
+    
+    query = {"_id": ObjectId(article_id)}
+    if expected_version is not None:
+        # Документы, созданные до появления version, считаются версией 0
+        query["version"] = expected_version if expected_version else {"$in": [0, None]}
+    
+    before = await db.articles.find_one_and_update(query, [{"$set": values}], return_document=ReturnDocument.BEFORE)
+    if before is None:
+        current = await db.articles.find_one({"_id": ObjectId(article_id)}, {"version": 1}) if expected_version is not None else None
+        if current is None:
+            return {"error": "Article not found"}
+        return MongoJSONResponse(
+            {"error": "Article was modified by another request", "version": current.get("version", 0)},
+            status_code=412
+        )
+    
+    # Документ после обновления (те же правила, что в pipeline) - без повторного чтения
+    after = {**before, **update_data, "updated_at": now, "version": before.get("version", 0) + 1}
+    if "status" in update_data:
+        after["published_at"] = (before.get("published_at") or now) if update_data["status"] == ArticleStatus.PUBLISHED.value else None
+    
+    # Обновляем счетчики авторов: смена статуса публикации и/или смена автора статьи
+    old_author_id = before.get("author_id")
+    new_author_id = after.get("author_id")
+    was_published = int(before.get("status") == ArticleStatus.PUBLISHED.value)
+    is_published = int(after.get("status") == ArticleStatus.PUBLISHED.value)
+    
+    author_changed = str(new_author_id) != str(old_author_id)
+    category_changed = str(after.get("category_id")) != str(before.get("category_id"))
+    comment_dates = []
+    if author_changed or category_changed:
+        # Комментарии статьи (и архивные - они тоже учтены в счетчиках) переходят к новому
+        # автору/категории вместе с датами для аналитики
+        comment_dates = [
+            c.get("created_at")
+            for collection in (db.comments, db.comments_archive)
+            for c in await collection.find({"article_id": ref_filter(article_id)}, {"created_at": 1}).to_list()
+        ]
+    
+    if author_changed:
+        await increment_author_activity(old_author_id, published=-was_published, comments=-len(comment_dates))
+        await increment_author_activity(new_author_id, published=is_published, comments=len(comment_dates))
+    else:
+        await increment_author_activity(old_author_id, published=is_published - was_published)
+    
+    # Аналитика: публикация снимается с дня старой даты публикации и ставится на день новой
+    analytics = {}
+    if was_published:
+        add_analytics_change(analytics, before.get("published_at"), old_author_id, before.get("category_id"), published=-1)
+    if is_published:
+        add_analytics_change(analytics, after.get("published_at"), new_author_id, after.get("category_id"), published=1)
+    for created_at in comment_dates:
+        add_analytics_change(analytics, created_at, old_author_id, before.get("category_id"), comments=-1)
+        add_analytics_change(analytics, created_at, new_author_id, after.get("category_id"), comments=1)
+    await increment_analytics(analytics)
+    await collections_changed("articles")
+    
+    # Имена автора и категории - как в GET /articles/{article_id}
+    after["author_name"] = after.get("author_name") or "Неизвестно"
+    after["category_name"] = after.get("category_name") or "Неизвестно"
+    
+    return MongoJSONResponse({"success": True, "modified_count": 1, "article": after})
+
+# Частичное обновление статьи (только статус)
+@app.put("/articles/{article_id}")
+async def update_article(article_id: str, article_data: dict, if_match: Optional[str] = Header(None)):
+    try:
+        update_data = {"status": article_data["status"]} if "status" in article_data else {}
+        return await update_article_atomically(article_id, update_data, parse_if_match(if_match))
         
-        # Преобразуем в словари поиска
-        articles_dict = {str(item["_id"]): item["published_articles_count"] for item in published_articles}
-        comments_dict = {str(item["_id"]): item["total_comments_count"] for item in comments_by_author}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error updating article {article_id}: {str(e)}")
+        return {"error": str(e)}
+
+# Полное обновление статьи (все поля)
+@app.put("/articles/{article_id}/full")
+async def update_article_full(article_id: str, article_data: dict, if_match: Optional[str] = Header(None)):
+    try:
+        # Обновляем только переданные поля (кроме _id)
+        allowed_fields = ['title', 'content', 'author_id', 'category_id', 'status']
+        update_data = {field: article_data[field] for field in allowed_fields if field in article_data}
         
-        # Получаем всех авторов
-        authors = list(db.authors.find())
+        # Ссылки на автора и категорию храним как ObjectId, вместе с ними - их имена
+        for field, collection, name_field, source_field in [
+            ('author_id', db.authors, 'author_name', 'full_name'),
+            ('category_id', db.categories, 'category_name', 'name')
+        ]:
+            if field in update_data:
+                update_data[field] = to_object_id(update_data[field])
+                names = await fetch_field_by_ids(collection, [update_data[field]], source_field)
+                update_data[name_field] = names.get(str(update_data[field]))
         
-        # Формируем результат
-        result = []
-        for author in authors:
-            author_id = str(author["_id"])
-            result.append({
-                "author_name": author["full_name"],
-                "published_articles_count": articles_dict.get(author_id, 0),
-                "total_comments_count": comments_dict.get(author_id, 0),
-                "email": author.get("email", ""),
-                "registration_date": author.get("registration_date")
-            })
+        return await update_article_atomically(article_id, update_data, parse_if_match(if_match))
         
-        return to_str(result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error updating article {article_id}: {str(e)}")
+        return {"error": str(e)}
+
+# Порядок сортировки статей и комментариев (новые первыми, _id - для однозначности курсора)
+NEWEST_FIRST = [("created_at", -1), ("_id", -1)]
+
+# "Неизвестно" вместо отсутствующих имен автора и категории (для запрошенных полей)
+def fill_missing_names(articles, fields=None):
+    with_author = field_requested(fields, "author_name")
+    with_category = field_requested(fields, "category_name")
+    for article in articles:
+        if with_author:
+            article["author_name"] = article.get("author_name") or "Неизвестно"
+        if with_category:
+            article["category_name"] = article.get("category_name") or "Неизвестно"
+
+# Получение списка статей с фильтрацией (постранично)
+@app.get("/articles/")
+async def get_articles(
+    status: Optional[ArticleStatus] = Query(None),                  # Фильтр по статусу
+    author_id: Optional[str] = Query(None),                         # Фильтр по автору
+    category_id: Optional[str] = Query(None),                       # Фильтр по категории
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),  # Размер страницы
+    after: Optional[str] = Query(None),                             # Курсор из заголовка X-Next-Cursor
+    fields: Optional[str] = Query(None),                            # Возвращаемые поля через запятую
+    include_archived: Annotated[bool, Query()] = False              # Добавить статьи из архива
+):
+    query = {}
+    
+    if status:
+        query["status"] = status.value
+    
+    if author_id:
+        query["author_id"] = ref_filter(author_id)
+    
+    if category_id:
+        query["category_id"] = ref_filter(category_id)
+    
+    # Получаем страницу статей с сортировкой по дате создания (новые первыми);
+    # created_at нужен для курсора
+    archive = db.articles_archive if include_archived else None
+    articles, next_cursor = await fetch_page(db.articles, query, NEWEST_FIRST, limit, after, build_projection(fields, ["created_at"]), archive)
+    
+    # Имена автора и категории хранятся в самих статьях
+    fill_missing_names(articles, fields)
+    return page_response(articles, next_cursor)
+
+# Получение конкретной статьи по ID (в том числе архивной).
+# ETag ответа - версия статьи ("3"), ее же принимает If-Match при обновлении
+@app.get("/articles/{article_id}")
+async def get_article(article_id: str, request: Request):
+    article = await db.articles.find_one({"_id": ObjectId(article_id)})
+    if not article:
+        article = await db.articles_archive.find_one({"_id": ObjectId(article_id)})
+    if not article:
+        return {"error": "Article not found"}
+    
+    etag = f'"{article.get("version", 0)}"'
+    if not_modified(request, etag, None):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    
+    # Имена автора и категории хранятся в самой статье
+    fill_missing_names([article])
+    return MongoJSONResponse(article, headers={"ETag": etag})
+
+#ЭНДПОИНТЫ ДЛЯ РАБОТЫ С КОММЕНТАРИЯМИ
+# Документ комментария для сохранения в MongoDB
+def comment_document(comment):
+    comment_dict = comment.dict()
+    # Ссылку на статью храним как ObjectId
+    comment_dict["article_id"] = to_object_id(comment.article_id)
+    comment_dict["content_hash"] = comment_content_hash(comment_dict["article_id"], comment.author_name, comment.content)
+    return comment_dict
+
+# Хэш ключа дедупликации комментария (статья, автор, текст): по нему построен уникальный
+# индекс вместо индекса по полному тексту комментария
+def comment_content_hash(article_id, author_name, content):
+    return hashlib.sha256("\0".join((str(article_id), author_name or "", content or "")).encode()).hexdigest()
+
+# Размер фильтра недавних комментариев (0 - без фильтра)
+COMMENT_BLOOM_CAPACITY = int(os.getenv("COMMENT_BLOOM_CAPACITY", "100000"))
+
+# Фильтр Блума по хэшам недавно созданных комментариев. Отрицательный ответ не означает,
+# что дубликата нет (фильтр знает только комментарии, созданные этим процессом), поэтому
+# он лишь ускоряет типичный спам - повтор только что отправленного текста: такой запрос
+# отклоняется одним чтением по индексу без попытки вставки. Хранит два поколения: когда
+# текущее заполняется, предыдущее отбрасывается.
+class RecentBloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / max(capacity, 1) * math.log(2)))
+        self._current = bytearray((self.size + 7) // 8)
+        self._previous = bytearray(len(self._current))
+        self._count = 0
+        self._lock = threading.Lock()
+    
+    # Номера битов для шестнадцатеричного хэша (двойное хэширование)
+    def _positions(self, content_hash):
+        first = int(content_hash[:16], 16)
+        second = int(content_hash[16:32], 16) | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+    
+    def add(self, content_hash):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            if self._count >= self.capacity:
+                self._previous, self._current = self._current, bytearray(len(self._current))
+                self._count = 0
+            for position in self._positions(content_hash):
+                self._current[position >> 3] |= 1 << (position & 7)
+            self._count += 1
+    
+    def __contains__(self, content_hash):
+        if self.capacity <= 0:
+            return False
+        positions = self._positions(content_hash)
+        with self._lock:
+            return any(
+                all(bits[position >> 3] & (1 << (position & 7)) for position in positions)
+                for bits in (self._current, self._previous)
+            )
+
+recent_comments = RecentBloomFilter(COMMENT_BLOOM_CAPACITY)
+
+# Создание нового комментария
+@app.post("/comments/")
+async def create_comment(comment: Comment):
+    wait = comment_author_limiter.acquire(comment.author_name)
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many comments from this author", headers=retry_after_headers(wait))
+    
+    comment_dict = comment_document(comment)
+    content_hash = comment_dict["content_hash"]
+    
+    # Недавно отправленный текст: проверка одним чтением по индексу content_hash
+    if content_hash in recent_comments:
+        existing_comment = await db.comments.find_one({"content_hash": content_hash}, {"_id": 1})
+        if existing_comment:
+            return {"error": "Similar comment already exists", "id": str(existing_comment["_id"])}
+    
+    # Вставка комментария (дубликаты отсекает уникальный индекс)
+    try:
+        result = await db.comments.insert_one(comment_dict)
+    except DuplicateKeyError:
+        recent_comments.add(content_hash)
+        existing_comment = await db.comments.find_one({"content_hash": content_hash}, {"_id": 1})
+        return {"error": "Similar comment already exists", "id": str(existing_comment["_id"]) if existing_comment else None}
+    
+    recent_comments.add(content_hash)
+    await count_comments([comment_dict], 1)
+    await collections_changed("comments")
+    return {"id": str(result.inserted_id)}
+
+# Одобрение комментария
+@app.put("/comments/{comment_id}/approve")
+async def approve_comment(comment_id: str):
+    result = await db.comments.update_one(
+        {"_id": ObjectId(comment_id)},
+        {"$set": {"is_approved": True}}
+    )
+    await collections_changed("comments")
+    return {"modified_count": result.modified_count}
+
+# Отмена одобрения комментария
+@app.put("/comments/{comment_id}/unapprove")
+async def unapprove_comment(comment_id: str):
+    result = await db.comments.update_one(
+        {"_id": ObjectId(comment_id)},
+        {"$set": {"is_approved": False}}
+    )
+    await collections_changed("comments")
+    return {"modified_count": result.modified_count}
+
+# Добавление заголовков статей к комментариям (один запрос на всю страницу)
+async def attach_article_titles(comments):
+    titles = await fetch_field_by_ids(db.articles, (c.get("article_id") for c in comments), "title", db.articles_archive)
+    for comment in comments:
+        comment["article_title"] = titles.get(str(comment.get("article_id")), "Неизвестно")
+
+# Фильтр комментариев по статье и статусу одобрения
+def comments_filter(article_id=None, is_approved=None):
+    query = {}
+    
+    if article_id:
+        query["article_id"] = ref_filter(article_id)
+    
+    if is_approved is not None:
+        query["is_approved"] = is_approved
+    
+    return query
+
+# Получение комментариев с фильтрацией (постранично)
+@app.get("/comments/")
+async def get_comments(
+    article_id: Optional[str] = Query(None),                        # Фильтр по статье
+    is_approved: Optional[bool] = Query(None),                      # Фильтр по статусу одобрения
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),  # Размер страницы
+    after: Optional[str] = Query(None),                             # Курсор из заголовка X-Next-Cursor
+    fields: Optional[str] = Query(None),                            # Возвращаемые поля через запятую
+    include_archived: Annotated[bool, Query()] = False              # Добавить комментарии из архива
+):
+    query = comments_filter(article_id, is_approved)
+    
+    with_title = field_requested(fields, "article_title")
+    required = ["created_at", "article_id"] if with_title else ["created_at"]
+    archive = db.comments_archive if include_archived else None
+    comments, next_cursor = await fetch_page(db.comments, query, NEWEST_FIRST, limit, after, build_projection(fields, required), archive)
+    
+    if with_title:
+        await attach_article_titles(comments)
+    
+    return page_response(comments, next_cursor)
+
+# Порядок очереди модерации: сначала самые старые комментарии
+OLDEST_FIRST = [("created_at", 1), ("_id", 1)]
+
+# Очередь модерации: неодобренные комментарии от старых к новым (постранично).
+# Страница читается по индексу is_approved_created_at_id в обратном направлении, число
+# ожидающих комментариев считается по тому же индексу без чтения документов и передается
+# в заголовке X-Pending-Count (только для первой страницы).
+@app.get("/comments/moderation-queue")
+async def get_moderation_queue(
+    article_id: Optional[str] = Query(None),                        # Фильтр по статье
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),  # Размер страницы
+    after: Optional[str] = Query(None),                             # Курсор из заголовка X-Next-Cursor
+    fields: Optional[str] = Query(None)                             # Возвращаемые поля через запятую
+):
+    query = comments_filter(article_id, False)
+    
+    with_title = field_requested(fields, "article_title")
+    required = ["created_at", "article_id"] if with_title else ["created_at"]
+    comments, next_cursor = await fetch_page(db.comments, query, OLDEST_FIRST, limit, after, build_projection(fields, required))
+    
+    if with_title:
+        await attach_article_titles(comments)
+    
+    response = page_response(comments, next_cursor)
+    if not after:
+        response.headers["X-Pending-Count"] = str(await db.comments.count_documents(query))
+    return response
+
+# Удаление комментария
+@app.delete("/comments/{comment_id}")
+async def delete_comment(comment_id: str):
+    try:
+        # Проверяем, существует ли комментарий
+        comment = await db.comments.find_one({"_id": ObjectId(comment_id)})
+        if not comment:
+            return {"error": "Comment not found", "deleted_count": 0}
+        
+        # Удаляем комментарий
+        result = await db.comments.delete_one({"_id": ObjectId(comment_id)})
+        if result.deleted_count > 0:
+            await count_comments([comment], -1)
+        await collections_changed("comments")
+        
+        if result.deleted_count > 0:
+            return {"success": True, "deleted_count": result.deleted_count}
+        else:
+            return {"error": "Failed to delete comment", "deleted_count": 0}
+            
+    except Exception as e:
+        logger.error(f"Error deleting comment {comment_id}: {str(e)}")
+        return {"error": str(e), "deleted_count": 0}
+
+#ПАКЕТНЫЕ ОПЕРАЦИИ
+# Массив элементов проверяется моделями Article/Comment по отдельности, дубликаты ищутся
+# одним запросом, запись выполняется одним неупорядоченным bulk_write. Ответ содержит
+# результат по каждому элементу в порядке запроса.
+
+# Максимальное число элементов в одном пакетном запросе
+MAX_BULK_SIZE = int(os.getenv("MAX_BULK_SIZE", "1000"))
+
+# Проверка элементов пакета моделью; возвращает [(индекс, модель)] и ошибки по индексам
+def validate_bulk_items(items, model):
+    valid = []
+    results = {}
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, model.model_validate(item)))
+        except ValidationError as e:
+            results[index] = {
+                "index": index,
+                "error": "Validation failed",
+                "details": e.errors(include_url=False, include_context=False, include_input=False)
+            }
+    return valid, results
+
+# Вставка подготовленных документов одним bulk_write; documents = [(индекс, документ)].
+# Возвращает индексы, отклоненные уникальным индексом (гонка с параллельной вставкой)
+async def bulk_insert(collection, documents):
+    if not documents:
+        return set()
+    
+    try:
+        await collection.bulk_write([InsertOne(doc) for _, doc in documents], ordered=False)
+        return set()
+    except BulkWriteError as e:
+        failed = set()
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") != 11000:
+                raise
+            failed.add(documents[error["index"]][0])
+        return failed
+
+# Сводка по результатам пакетной операции
+def bulk_summary(results, count):
+    items = [results[index] for index in range(count)]
+    return {
+        "results": items,
+        "inserted_count": sum(1 for item in items if item.get("success")),
+        "error_count": sum(1 for item in items if not item.get("success"))
+    }
+
+# Пакетное создание статей
+@app.post("/articles/bulk")
+async def create_articles_bulk(items: List[dict]):
+    if len(items) > MAX_BULK_SIZE:
+        return {"error": f"Too many items, maximum is {MAX_BULK_SIZE}"}
+    
+    valid, results = validate_bulk_items(items, Article)
+    
+    # Существующие статьи с теми же (заголовок, автор) - одним запросом
+    existing = {}
+    if valid:
+        found = await db.articles.find(
+            {"$or": [{"title": article.title, "author_id": ref_filter(article.author_id)} for _, article in valid]},
+            {"title": 1, "author_id": 1}
+        ).to_list()
+        existing = {(doc["title"], str(doc["author_id"])): doc["_id"] for doc in found}
+    
+    documents = []
+    for index, article in valid:
+        key = (article.title, str(article.author_id))
+        if key in existing:
+            results[index] = {"index": index, "error": "Article with this title by this author already exists", "id": str(existing[key])}
+            continue
+        
+        document = article_document(article)
+        document["_id"] = ObjectId()
+        existing[key] = document["_id"]  # Дубликаты внутри самого пакета
+        documents.append((index, document))
+    
+    await attach_display_names([document for _, document in documents])
+    failed = await bulk_insert(db.articles, documents)
+    
+    changes = {}
+    analytics = {}
+    for index, document in documents:
+        if index in failed:
+            results[index] = {"index": index, "error": "Article with this title by this author already exists"}
+            continue
+        
+        results[index] = {"index": index, "success": True, "id": str(document["_id"])}
+        if document["status"] == ArticleStatus.PUBLISHED:
+            published, comments = changes.get(str(document["author_id"]), (0, 0))
+            changes[str(document["author_id"])] = (published + 1, comments)
+            add_analytics_change(analytics, document["published_at"], document["author_id"], document["category_id"], published=1)
+    
+    await increment_author_activity_many(changes)
+    await increment_analytics(analytics)
+    await collections_changed("articles")
+    return bulk_summary(results, len(items))
+
+# Пакетное создание комментариев
+@app.post("/comments/bulk")
+async def create_comments_bulk(items: List[dict]):
+    if len(items) > MAX_BULK_SIZE:
+        return {"error": f"Too many items, maximum is {MAX_BULK_SIZE}"}
+    
+    valid, results = validate_bulk_items(items, Comment)
+    
+    # Предел комментариев от одного автора действует и на пакет: каждый элемент списывает
+    # единицу из запаса своего автора, элементы сверх запаса отклоняются
+    allowed = []
+    for index, comment in valid:
+        wait = comment_author_limiter.acquire(comment.author_name)
+        if wait:
+            results[index] = {"index": index, "error": "Too many comments from this author", "retry_after": retry_after_headers(wait)["Retry-After"]}
+        else:
+            allowed.append((index, comment))
+    
+    # Существующие комментарии с тем же (статья, автор, текст) - одним запросом по индексу content_hash
+    prepared = [(index, comment_document(comment)) for index, comment in allowed]
+    existing = {}
+    if prepared:
+        found = await db.comments.find(
+            {"content_hash": {"$in": [document["content_hash"] for _, document in prepared]}},
+            {"content_hash": 1}
+        ).to_list()
+        existing = {doc["content_hash"]: doc["_id"] for doc in found}
+    
+    documents = []
+    for index, document in prepared:
+        key = document["content_hash"]
+        if key in existing:
+            results[index] = {"index": index, "error": "Similar comment already exists", "id": str(existing[key])}
+            continue
+        
+        document["_id"] = ObjectId()
+        existing[key] = document["_id"]  # Дубликаты внутри самого пакета
+        documents.append((index, document))
+    
+    failed = await bulk_insert(db.comments, documents)
+    
+    inserted = []
+    for index, document in documents:
+        if index in failed:
+            results[index] = {"index": index, "error": "Similar comment already exists"}
+            continue
+        
+        results[index] = {"index": index, "success": True, "id": str(document["_id"])}
+        recent_comments.add(document["content_hash"])
+        inserted.append(document)
+    
+    await count_comments(inserted, 1)
+    await collections_changed("comments")
+    return bulk_summary(results, len(items))
+
+# Пакетная модерация комментариев (одобрение, возврат на модерацию, удаление)
+@app.post("/comments/moderate")
+async def moderate_comments_bulk(actions: List[ModerationAction]):
+    if len(actions) > MAX_BULK_SIZE:
+        return {"error": f"Too many items, maximum is {MAX_BULK_SIZE}"}
+    
+    # Существующие комментарии - одним запросом (нужны и для ответа, и для счетчиков при удалении)
+    object_ids = [ObjectId(a.comment_id) for a in actions if ObjectId.is_valid(a.comment_id)]
+    found = await db.comments.find({"_id": {"$in": object_ids}}, {"article_id": 1, "created_at": 1}).to_list() if object_ids else []
+    comments = {str(doc["_id"]): doc for doc in found}
+    
+    results = []
+    operations = []
+    deleted = []
+    for index, action in enumerate(actions):
+        comment = comments.get(action.comment_id)
+        if comment is None:
+            results.append({"index": index, "comment_id": action.comment_id, "error": "Comment not found"})
+            continue
+        
+        if action.action == "delete":
+            operations.append(DeleteOne({"_id": comment["_id"]}))
+            deleted.append(comment)
+            comments.pop(action.comment_id)  # Повторное действие с удаленным комментарием
+        else:
+            operations.append(UpdateOne({"_id": comment["_id"]}, {"$set": {"is_approved": action.action == "approve"}}))
+        results.append({"index": index, "comment_id": action.comment_id, "success": True, "action": action.action})
+    
+    modified_count = 0
+    deleted_count = 0
+    if operations:
+        result = await db.comments.bulk_write(operations, ordered=False)
+        modified_count = result.modified_count
+        deleted_count = result.deleted_count
+    
+    # Счетчики комментариев авторов статей и аналитика для удаленных комментариев
+    if deleted:
+        await count_comments(deleted, -1)
+    
+    await collections_changed("comments")
+    return {"results": results, "modified_count": modified_count, "deleted_count": deleted_count}
+
+#СВОДНЫЕ ТАБЛИЦЫ (АНАЛИТИКА)
+
+# Поля статьи, необходимые таблице управления контентом (без содержимого статьи)
+CONTENT_MANAGEMENT_FIELDS = {"title": 1, "author_name": 1, "category_name": 1, "status": 1, "created_at": 1, "published_at": 1}
+
+# Запись таблицы управления контентом
+def content_management_row(article):
+    return {
+        "_id": str(article.get("_id", "")),
+        "title": article.get("title", "Без названия"),
+        "author_name": article.get("author_name") or "Неизвестно",
+        "category_name": article.get("category_name") or "Без категории",
+        "status": article.get("status", "Не указан"),
+        "created_at": article.get("created_at"),
+        "published_at": article.get("published_at")
+    }
+
+# 1. Управление контентом: список статей с расширенной информацией (постранично)
+@app.get("/content-management/")
+async def get_content_management(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),  # Размер страницы
+    after: Optional[str] = Query(None)                              # Курсор из заголовка X-Next-Cursor
+):
+    try:
+        articles, next_cursor = await fetch_page(db.articles, {}, NEWEST_FIRST, limit, after, CONTENT_MANAGEMENT_FIELDS)
+        
+        # Формируем записи для таблицы управления контентом (имена хранятся в статьях)
+        result = [content_management_row(article) for article in articles]
+        return page_response(result, next_cursor)
+        
+    except Exception as e:
+        logger.error(f"Error in content-management: {str(e)}")
+        return {"error": str(e)}
+
+#ЭКСПОРТ ДАННЫХ
+# Выгрузка таблиц целиком потоком: строки читаются из курсора пакетами, имена подставляются
+# одним запросом на пакет, поэтому память не зависит от размера коллекции.
+
+# Размер пакета при потоковой выгрузке
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Поля выгружаемых таблиц (порядок колонок CSV)
+CONTENT_MANAGEMENT_COLUMNS = ["_id", "title", "author_name", "category_name", "status", "created_at", "published_at"]
+COMMENTS_COLUMNS = ["_id", "article_id", "article_title", "author_name", "content", "created_at", "is_approved"]
+
+# Чтение курсора пакетами
+async def iterate_batches(cursor, batch_size=EXPORT_BATCH_SIZE):
+    while True:
+        batch = await cursor.to_list(batch_size)
+        if not batch:
+            return
+        yield batch
+
+# Значение ячейки CSV
+def csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return str(value.value)
+    return str(value)
+
+# Кодирование потока пакетов строк в NDJSON или CSV
+async def encode_rows(batches, export_format, columns):
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM, чтобы Excel распознал UTF-8 (кириллицу)
+        yield ("\ufeff" + ",".join(columns) + "\r\n").encode("utf-8")
+        async for rows in batches:
+            for row in rows:
+                writer.writerow([csv_value(row.get(column)) for column in columns])
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    else:
+        async for rows in batches:
+            yield b"".join(orjson.dumps(row, default=encode_mongo_value) + b"\n" for row in rows)
+
+# Потоковый ответ с выгрузкой в виде файла
+def export_response(rows, export_format, columns, filename):
+    media_type = "text/csv; charset=utf-8" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        encode_rows(rows, export_format, columns),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
+
+# Строки таблицы управления контентом, пакет за пакетом
+async def content_management_batches():
+    cursor = db.articles.find({}, CONTENT_MANAGEMENT_FIELDS).sort(NEWEST_FIRST).batch_size(EXPORT_BATCH_SIZE)
+    async for articles in iterate_batches(cursor):
+        yield [content_management_row(article) for article in articles]
+
+# Строки комментариев с заголовками статей, пакет за пакетом
+async def comments_batches(query):
+    cursor = db.comments.find(query).sort(NEWEST_FIRST).batch_size(EXPORT_BATCH_SIZE)
+    async for comments in iterate_batches(cursor):
+        await attach_article_titles(comments)
+        yield comments
+
+# Выгрузка таблицы управления контентом целиком (NDJSON или CSV)
+@app.get("/content-management/export")
+async def export_content_management(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$")  # Формат выгрузки
+):
+    return export_response(content_management_batches(), format, CONTENT_MANAGEMENT_COLUMNS, "content-management")
+
+# Выгрузка комментариев целиком с фильтрацией (NDJSON или CSV)
+@app.get("/comments/export")
+async def export_comments(
+    article_id: Optional[str] = Query(None),                 # Фильтр по статье
+    is_approved: Optional[bool] = Query(None),               # Фильтр по статусу одобрения
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$")  # Формат выгрузки
+):
+    return export_response(comments_batches(comments_filter(article_id, is_approved)), format, COMMENTS_COLUMNS, "comments")
+
+# Витрина активности авторов целиком
+async def load_author_activity():
+    return await db.author_activity.find({}, {"_id": 0}).sort("_id", 1).to_list()
+
+# 2. Активность авторов: статистика по каждому автору (чтение готовой витрины author_activity)
+@app.get("/author-activity/")
+async def get_author_activity():
+    try:
+        result = await analytics_flight.run("author-activity", load_author_activity)
+        return MongoJSONResponse(result)
         
     except Exception as e:
         logger.error(f"Error in author-activity: {str(e)}")
         return {"error": str(e)}
 
+# Стадии агрегации: статья комментария (поле article) из рабочей коллекции или из архива
+def article_lookup_stages(local_field):
+    return [
+        {"$lookup": {"from": "articles", "localField": local_field, "foreignField": "_id", "as": "article"}},
+        {"$lookup": {"from": "articles_archive", "localField": local_field, "foreignField": "_id", "as": "archived_article"}},
+        {"$addFields": {"article": {"$concatArrays": ["$article", "$archived_article"]}}},
+        {"$unwind": "$article"}
+    ]
+
+# Полный пересчет витрины активности авторов по исходным коллекциям и архиву (заполнение и исправление)
+async def rebuild_author_activity(database):
+    # Агрегационный запрос для подсчета опубликованных статей
+    articles_pipeline = [
+        {"$match": {"status": ArticleStatus.PUBLISHED.value}},
+        {
+            "$group": {
+                "_id": "$author_id",
+                "published_articles_count": {"$sum": 1}
+            }
+        }
+    ]
+    
+    # Агрегационный запрос для подсчета комментариев к статьям автора.
+    # Пока миграция ссылок не завершена, часть article_id хранится строкой и требует $toObjectId
+    local_field = "article_id"
+    conversion = []
+    if not await references_migrated(database):
+        local_field = "article_object_id"
+        conversion = [{"$addFields": {"article_object_id": {"$toObjectId": "$article_id"}}}]
+    
+    comments_pipeline = conversion + article_lookup_stages(local_field) + [
+        {
+            "$group": {
+                "_id": "$article.author_id",
+                "total_comments_count": {"$sum": 1}
+            }
+        }
+    ]
+    
+    # Преобразуем в словари поиска (рабочие коллекции и архив)
+    articles_dict = {}
+    for collection in (database.articles, database.articles_archive):
+        for item in await (await collection.aggregate(articles_pipeline)).to_list():
+            articles_dict[str(item["_id"])] = articles_dict.get(str(item["_id"]), 0) + item["published_articles_count"]
+    comments_dict = {}
+    for collection in (database.comments, database.comments_archive):
+        for item in await (await collection.aggregate(comments_pipeline)).to_list():
+            comments_dict[str(item["_id"])] = comments_dict.get(str(item["_id"]), 0) + item["total_comments_count"]
+    
+    # Перезаписываем документ витрины для каждого автора
+    operations = []
+    author_ids = []
+    async for author in database.authors.find():
+        author_id = str(author["_id"])
+        author_ids.append(author_id)
+        operations.append(ReplaceOne({"_id": author_id}, {
+            "author_name": author["full_name"],
+            "published_articles_count": articles_dict.get(author_id, 0),
+            "total_comments_count": comments_dict.get(author_id, 0),
+            "email": author.get("email", ""),
+            "registration_date": author.get("registration_date")
+        }, upsert=True))
+        
+        if len(operations) >= 1000:
+            await database.author_activity.bulk_write(operations, ordered=False)
+            operations = []
+    
+    if operations:
+        await database.author_activity.bulk_write(operations, ordered=False)
+    
+    # Удаляем записи авторов, которых больше нет
+    await database.author_activity.delete_many({"_id": {"$nin": author_ids}})
+    logger.info(f"Author activity rebuilt for {len(author_ids)} authors")
+
 #СТАТИСТИКА
 
-# Общая статистика блога
+# Агрегация по статьям: общее число, распределение по статусам и по категориям за один проход
+ARTICLES_STATISTICS_PIPELINE = [
+    {
+        "$facet": {
+            "total": [{"$count": "count"}],
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "by_category": [{"$group": {"_id": "$category_id", "count": {"$sum": 1}}}]
+        }
+    }
+]
+
+# Агрегация по комментариям: общее число и число одобренных за один проход
+COMMENTS_STATISTICS_PIPELINE = [
+    {
+        "$facet": {
+            "total": [{"$count": "count"}],
+            "approved": [{"$match": {"is_approved": True}}, {"$count": "count"}]
+        }
+    }
+]
+
+# Значение $count из результата $facet (пустой массив, если документов нет)
+def facet_count(facet):
+    return facet[0]["count"] if facet else 0
+
+# Вычисление общей статистики: фиксированное число запросов независимо от количества категорий.
+# Архивные статьи и комментарии учитываются наравне с рабочими
+async def compute_statistics():
+    total_authors = await db.authors.estimated_document_count()
+    categories = await db.categories.find({}, {"name": 1}).to_list()
+    
+    # Подсчет основных метрик
+    # Ключи категорий приводим к строке: ссылки хранятся как ObjectId (или строкой до миграции ссылок)
+    total_articles = 0
+    by_status = {}
+    by_category = {}
+    for collection in (db.articles, db.articles_archive):
+        articles_facet = (await (await collection.aggregate(ARTICLES_STATISTICS_PIPELINE)).to_list())[0]
+        total_articles += facet_count(articles_facet["total"])
+        for item in articles_facet["by_status"]:
+            by_status[item["_id"]] = by_status.get(item["_id"], 0) + item["count"]
+        for item in articles_facet["by_category"]:
+            key = str(item["_id"]) if item["_id"] else item["_id"]
+            by_category[key] = by_category.get(key, 0) + item["count"]
+    
+    total_comments = 0
+    total_approved_comments = 0
+    for collection in (db.comments, db.comments_archive):
+        comments_facet = (await (await collection.aggregate(COMMENTS_STATISTICS_PIPELINE)).to_list())[0]
+        total_comments += facet_count(comments_facet["total"])
+        total_approved_comments += facet_count(comments_facet["approved"])
+    
+    total_published = by_status.get(ArticleStatus.PUBLISHED.value, 0)
+    total_moderation = by_status.get(ArticleStatus.MODERATION.value, 0)
+    total_drafts = by_status.get(ArticleStatus.DRAFT.value, 0)
+    
+    # Статистика по категориям
+    categories_stats = []
+    
+    for category in categories:
+        categories_stats.append({
+            "_id": category.get("name", "Без названия"),
+            "count": by_category.get(str(category["_id"]), 0)
+        })
+    
+    # Статьи без категории (поле отсутствует, пустое или null)
+    uncategorized_count = by_category.get(None, 0) + by_category.get("", 0)
+    
+    if uncategorized_count > 0:
+        categories_stats.append({
+            "_id": "Без категории",
+            "count": uncategorized_count
+        })
+    
+    # Возвращаем все собранные статистические данные
+    return {
+        "total_articles": total_articles,
+        "total_published": total_published,
+        "total_moderation": total_moderation,
+        "total_drafts": total_drafts,
+        "total_authors": total_authors,
+        "total_comments": total_comments,
+        "total_approved_comments": total_approved_comments,
+        "categories_distribution": categories_stats,
+        "published_percentage": round((total_published / total_articles * 100) if total_articles > 0 else 0, 2)
+    }
+
+# Вычисление статистики с сохранением в кэш (одно на все одновременные промахи кэша)
+async def load_statistics():
+    generation = statistics_cache.generation
+    statistics = await compute_statistics()
+    statistics_cache.set("statistics", statistics, generation)
+    return statistics
+
+# Статистика из кэша или вычисленная заново
+async def cached_statistics():
+    statistics = statistics_cache.get("statistics")
+    if statistics is None:
+        statistics = await analytics_flight.run("statistics", load_statistics)
+    return statistics
+
+# Общая статистика блога (с кэшированием результата)
 @app.get("/statistics/")
-def get_statistics():
+async def get_statistics():
     try:
-        # Подсчет основных метрик
-        total_articles = db.articles.count_documents({})
-        total_published = db.articles.count_documents({"status": "Опубликовано"})
-        total_moderation = db.articles.count_documents({"status": "На модерации"})
-        total_drafts = db.articles.count_documents({"status": "Черновик"})
-        total_authors = db.authors.count_documents({})
-        total_comments = db.comments.count_documents({})
-        total_approved_comments = db.comments.count_documents({"is_approved": True})
-        
-        # Статистика по категориям
-        categories_stats = []
-        categories = list(db.categories.find())
-        
-        for category in categories:
-            count = db.articles.count_documents({"category_id": str(category["_id"])})
-            categories_stats.append({
-                "_id": category.get("name", "Без названия"),
-                "count": count
-            })
-        
-        # Статьи без категории
-        uncategorized_count = db.articles.count_documents({
-            "$or": [
-                {"category_id": {"$exists": False}},
-                {"category_id": ""},
-                {"category_id": None}
-            ]
-        })
-        
-        if uncategorized_count > 0:
-            categories_stats.append({
-                "_id": "Без категории",
-                "count": uncategorized_count
-            })
-        
-        # Возвращаем все собранные статистические данные
-        return {
-            "total_articles": total_articles,
-            "total_published": total_published,
-            "total_moderation": total_moderation,
-            "total_drafts": total_drafts,
-            "total_authors": total_authors,
-            "total_comments": total_comments,
-            "total_approved_comments": total_approved_comments,
-            "categories_distribution": categories_stats,
-            "published_percentage": round((total_published / total_articles * 100) if total_articles > 0 else 0, 2)
-        }
+        return MongoJSONResponse(await cached_statistics())
         
     except Exception as e:
         logger.error(f"Error in statistics: {str(e)}")
         return {"error": str(e)}
 
+# Метрики кэша статистики и объединения аналитических запросов
+@app.get("/cache-stats/")
+async def get_cache_stats():
+    return {
+        "statistics": statistics_cache.stats(),
+        "analytics_single_flight": analytics_flight.stats()
+    }
+
+#ПЕРВАЯ ЗАГРУЗКА СТРАНИЦ
+# GET /bootstrap отдает одним ответом справочники и первые страницы списков, которые
+# страницы админ-панели иначе запрашивают по очереди. Разделы читаются одновременно.
+
+# Страницы списков в ответе /bootstrap: {"items": [...], "next_cursor": ...}
+def bootstrap_page(docs, next_cursor):
+    return {"items": docs, "next_cursor": next_cursor}
+
+# Справочник авторов для фильтров и форм. Читается целиком, без ограничения размера
+# страницы: в форме редактирования статьи должен быть любой автор
+async def bootstrap_authors():
+    return await db.authors.find({}, {"full_name": 1}).sort([("_id", 1)]).to_list()
+
+# Справочник категорий для фильтров и форм (целиком, как и авторы)
+async def bootstrap_categories():
+    return await db.categories.find({}, {"name": 1}).sort([("_id", 1)]).to_list()
+
+# Заголовки статей для фильтра комментариев
+async def bootstrap_article_titles():
+    articles, _ = await fetch_page(db.articles, {}, NEWEST_FIRST, MAX_PAGE_SIZE, projection={"title": 1, "created_at": 1})
+    return articles
+
+# Первая страница списка статей (поля таблицы статей)
+async def bootstrap_articles():
+    fields = "title,status,created_at,author_name,category_name"
+    articles, next_cursor = await fetch_page(db.articles, {}, NEWEST_FIRST, DEFAULT_PAGE_SIZE, projection=build_projection(fields))
+    fill_missing_names(articles, fields)
+    return bootstrap_page(articles, next_cursor)
+
+# Первая страница комментариев с заголовками статей
+async def bootstrap_comments():
+    comments, next_cursor = await fetch_page(db.comments, {}, NEWEST_FIRST, DEFAULT_PAGE_SIZE)
+    await attach_article_titles(comments)
+    return bootstrap_page(comments, next_cursor)
+
+# Первая страница таблицы управления контентом
+async def bootstrap_content_management():
+    articles, next_cursor = await fetch_page(db.articles, {}, NEWEST_FIRST, DEFAULT_PAGE_SIZE, projection=CONTENT_MANAGEMENT_FIELDS)
+    return bootstrap_page([content_management_row(article) for article in articles], next_cursor)
+
+# Активность авторов
+async def bootstrap_author_activity():
+    return await analytics_flight.run("author-activity", load_author_activity)
+
+# Разделы ответа /bootstrap и функции их загрузки
+BOOTSTRAP_SECTIONS = {
+    "authors": bootstrap_authors,
+    "categories": bootstrap_categories,
+    "article_titles": bootstrap_article_titles,
+    "articles": bootstrap_articles,
+    "comments": bootstrap_comments,
+    "content_management": bootstrap_content_management,
+    "statistics": cached_statistics,
+    "author_activity": bootstrap_author_activity,
+}
+
+# Данные для первой загрузки страниц одним запросом
+@app.get("/bootstrap")
+async def get_bootstrap(
+    views: Optional[str] = Query(None)  # Разделы через запятую (по умолчанию все)
+):
+    names = [name.strip() for name in views.split(",") if name.strip()] if views else list(BOOTSTRAP_SECTIONS)
+    unknown = [name for name in names if name not in BOOTSTRAP_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown views: {', '.join(unknown)}")
+    
+    try:
+        results = await asyncio.gather(*(BOOTSTRAP_SECTIONS[name]() for name in names))
+        return MongoJSONResponse(dict(zip(names, results)))
+        
+    except Exception as e:
+        logger.error(f"Error in bootstrap: {str(e)}")
+        return {"error": str(e)}
+
+#АНАЛИТИКА ВО ВРЕМЕНИ
+
+# Начало периода (день, неделя с понедельника или месяц), к которому относится дата
+def period_start(day, granularity):
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+# Начало следующего периода
+def next_period(start, granularity):
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+# Временной ряд публикаций и комментариев по дневным счетчикам
+async def load_timeseries(scope, key, date_from, date_to, granularity):
+    docs = await db.analytics_daily.find(
+        {"scope": scope, "key": key, "day": {"$gte": analytics_day(date_from), "$lte": analytics_day(date_to)}},
+        {"_id": 0, "day": 1, "published_articles": 1, "comments": 1}
+    ).to_list()
+    
+    totals = {}
+    for doc in docs:
+        start = period_start(doc["day"].date(), granularity)
+        published, comments = totals.get(start, (0, 0))
+        totals[start] = (published + doc.get("published_articles", 0), comments + doc.get("comments", 0))
+    
+    # Периоды без публикаций и комментариев тоже входят в ряд (с нулями)
+    series = []
+    start = period_start(date_from, granularity)
+    while start <= date_to:
+        published, comments = totals.get(start, (0, 0))
+        series.append({"period": start, "published_articles": published, "comments": comments})
+        start = next_period(start, granularity)
+    
+    return {
+        "granularity": granularity,
+        "from": date_from,
+        "to": date_to,
+        "series": series,
+        "total_published_articles": sum(item["published_articles"] for item in series),
+        "total_comments": sum(item["comments"] for item in series)
+    }
+
+# Опубликованные статьи и полученные комментарии по дням, неделям или месяцам.
+# Читается не более одного документа analytics_daily на день диапазона (индекс scope_key_day_unique)
+@app.get("/analytics/timeseries")
+async def get_analytics_timeseries(
+    granularity: str = Query("day", pattern="^(day|week|month)$"),  # Размер периода
+    author_id: Optional[str] = Query(None),                         # Фильтр по автору
+    category_id: Optional[str] = Query(None),                       # Фильтр по категории
+    date_from: Optional[date] = Query(None, alias="from"),          # Первый день (по умолчанию - год назад)
+    date_to: Optional[date] = Query(None, alias="to")               # Последний день (по умолчанию - сегодня)
+):
+    if author_id and category_id:
+        raise HTTPException(status_code=400, detail="Filter by author or by category, not both")
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=365)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' must not be later than 'to'")
+    if (date_to - date_from).days >= ANALYTICS_MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must not exceed {ANALYTICS_MAX_RANGE_DAYS} days")
+    
+    if author_id:
+        scope, key = "author", author_id
+    elif category_id:
+        scope, key = "category", category_id
+    else:
+        scope, key = "all", ""
+    
+    try:
+        result = await analytics_flight.run(
+            ("timeseries", scope, key, date_from, date_to, granularity),
+            load_timeseries, scope, key, date_from, date_to, granularity
+        )
+        return MongoJSONResponse(result)
+        
+    except Exception as e:
+        logger.error(f"Error in analytics timeseries: {str(e)}")
+        return {"error": str(e)}
+
+# Выражение агрегации: начало дня для поля с датой
+def day_expression(field):
+    return {"$dateFromParts": {"year": {"$year": field}, "month": {"$month": field}, "day": {"$dayOfMonth": field}}}
+
+# Полный пересчет аналитики по дням по исходным коллекциям и архиву (заполнение и исправление).
+# Как и пересчет витрины авторов, выполняется при обслуживании: записи, сделанные во время
+# пересчета, могут не попасть в результат
+async def rebuild_analytics(database):
+    await database.analytics_daily.create_index(
+        [("scope", ASCENDING), ("key", ASCENDING), ("day", ASCENDING)],
+        name="scope_key_day_unique",
+        unique=True
+    )
+    
+    # Публикации по дню публикации, автору и категории
+    articles_pipeline = [
+        {"$match": {"status": ArticleStatus.PUBLISHED.value, "published_at": {"$ne": None}}},
+        {
+            "$group": {
+                "_id": {"day": day_expression("$published_at"), "author_id": "$author_id", "category_id": "$category_id"},
+                "count": {"$sum": 1}
+            }
+        }
+    ]
+    
+    # Комментарии сначала группируются по статье и дню, затем к группам присоединяются статьи
+    # (один $lookup на статью и день, а не на каждый комментарий)
+    local_field = "_id.article_id"
+    conversion = []
+    if not await references_migrated(database):
+        local_field = "article_object_id"
+        conversion = [{"$addFields": {"article_object_id": {"$toObjectId": "$_id.article_id"}}}]
+    
+    comments_pipeline = [
+        {"$group": {"_id": {"article_id": "$article_id", "day": day_expression("$created_at")}, "count": {"$sum": 1}}},
+    ] + conversion + article_lookup_stages(local_field) + [
+        {
+            "$group": {
+                "_id": {"day": "$_id.day", "author_id": "$article.author_id", "category_id": "$article.category_id"},
+                "count": {"$sum": "$count"}
+            }
+        }
+    ]
+    
+    changes = {}
+    for collection in (database.articles, database.articles_archive):
+        async for item in await collection.aggregate(articles_pipeline):
+            add_analytics_change(changes, item["_id"]["day"], item["_id"].get("author_id"), item["_id"].get("category_id"), published=item["count"])
+    for collection in (database.comments, database.comments_archive):
+        async for item in await collection.aggregate(comments_pipeline):
+            add_analytics_change(changes, item["_id"]["day"], item["_id"].get("author_id"), item["_id"].get("category_id"), comments=item["count"])
+    
+    # Перезаписываем документы пакетами; документы, не затронутые пересчетом, удаляются
+    rebuilt_at = datetime.now()
+    operations = []
+    for (day, scope, key), (published, comments) in changes.items():
+        operations.append(ReplaceOne({"scope": scope, "key": key, "day": day}, {
+            "scope": scope,
+            "key": key,
+            "day": day,
+            "published_articles": published,
+            "comments": comments,
+            "rebuilt_at": rebuilt_at
+        }, upsert=True))
+        
+        if len(operations) >= 1000:
+            await database.analytics_daily.bulk_write(operations, ordered=False)
+            operations = []
+    
+    if operations:
+        await database.analytics_daily.bulk_write(operations, ordered=False)
+    
+    await database.analytics_daily.delete_many({"rebuilt_at": {"$ne": rebuilt_at}})
+    logger.info(f"Daily analytics rebuilt: {len(changes)} documents")
+
 #ПОИСК
 
-# Универсальный поиск по контенту
+# Полнотекстовый запрос с сортировкой по релевантности (использует текстовый индекс коллекции).
+# С archive результаты обеих коллекций сливаются по релевантности
+async def text_search(collection, query, limit, archive=None):
+    docs = []
+    for source in (collection, archive) if archive is not None else (collection,):
+        docs += await source.find(
+            {"$text": {"$search": query}},
+            {"score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).limit(limit).to_list()
+    
+    docs.sort(key=lambda doc: doc.get("score", 0), reverse=True)
+    docs = docs[:limit]
+    for doc in docs:
+        doc.pop("score", None)
+    return docs
+
+# Универсальный поиск по контенту (текстовый индекс с русской морфологией)
 @app.get("/search/")
-def search_content(
+async def search_content(
     query: str = Query(..., min_length=2),  # Поисковый запрос (минимум 2 символа)
-    search_in: str = Query("all", regex="^(all|articles|comments)$")  # Где искать
+    search_in: str = Query("all", regex="^(all|articles|comments)$"),  # Где искать
+    include_archived: Annotated[bool, Query()] = False                  # Искать и в архиве
 ):
     results = {}
     
     # Поиск в статьях
     if search_in in ["all", "articles"]:
-        articles_query = {
-            "$or": [
-                {"title": {"$regex": query, "$options": "i"}},  # Поиск в заголовке
-                {"content": {"$regex": query, "$options": "i"}}  # Поиск в содержимом
-            ]
-        }
-        articles = list(db.articles.find(articles_query).limit(10))
+        articles = await text_search(db.articles, query, 10, db.articles_archive if include_archived else None)
         
-        # Добавляем информацию об авторе
+        # Имя автора хранится в самой статье
         for article in articles:
-            author = db.authors.find_one({"_id": ObjectId(article["author_id"])})
-            article["author_name"] = author["full_name"] if author else "Неизвестно"
+            article["author_name"] = article.get("author_name") or "Неизвестно"
         
-        results["articles"] = to_str(articles)
+        results["articles"] = articles
     
     # Поиск в комментариях
     if search_in in ["all", "comments"]:
-        comments_query = {
-            "content": {"$regex": query, "$options": "i"}
-        }
-        comments = list(db.comments.find(comments_query).limit(10))
+        comments = await text_search(db.comments, query, 10, db.comments_archive if include_archived else None)
+        
+        # Добавляем информацию о статье (один запрос на все найденные комментарии)
+        await attach_article_titles(comments)
+        
+        results["comments"] = comments
+    
+    return MongoJSONResponse(results)
+
+#ОБНОВЛЕНИЯ В РЕАЛЬНОМ ВРЕМЕНИ (SSE)
+# Процесс читает change stream статей и комментариев и рассылает изменения подключенным
+# к /events страницам. Изменения копятся LIVE_UPDATES_INTERVAL секунд и отправляются одним
+# сообщением: несколько изменений одного документа сливаются в одно, поэтому клиент получает
+# не больше одного сообщения за интервал независимо от частоты записей.
+
+# Рассылать изменения через /events (требуется набор реплик MongoDB и драйвер async)
+LIVE_UPDATES = os.getenv("LIVE_UPDATES", "0") == "1"
+
+# Интервал отправки накопленных изменений, с
+LIVE_UPDATES_INTERVAL = float(os.getenv("LIVE_UPDATES_INTERVAL", "1"))
+
+# Максимум изменений в одном сообщении; при большем числе клиентам отправляется reload
+LIVE_UPDATES_MAX_BATCH = int(os.getenv("LIVE_UPDATES_MAX_BATCH", "500"))
+
+# Число неотправленных сообщений на клиента; медленный клиент вместо них получает reload
+LIVE_UPDATES_QUEUE_SIZE = 16
+
+# Интервал комментария keep-alive для прокси и балансировщиков, с
+LIVE_UPDATES_KEEPALIVE = 15
+
+# Пауза перед повторным открытием change stream после сбоя, с
+LIVE_UPDATES_RETRY = 5
+
+# Коллекции, изменения которых рассылаются клиентам
+LIVE_UPDATES_COLLECTIONS = ("articles", "comments")
+
+# Накопление и рассылка изменений подписчикам /events
+class LiveUpdates:
+    def __init__(self):
+        self.subscribers = set()
+        self.pending = {}  # (коллекция, ID) -> {"op": ..., "document": ...}
+    
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=LIVE_UPDATES_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+    
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+    
+    # Добавление изменения документа (op - insert, update или delete)
+    def publish(self, collection, document_id, op, document=None):
+        if not self.subscribers:
+            return
+        key = (collection, str(document_id))
+        previous = self.pending.get(key)
+        if previous is not None and previous["op"] == "insert":
+            if op == "delete":
+                # Документ создан и удален за один интервал - клиенту сообщать не о чем
+                del self.pending[key]
+                return
+            op = "insert"
+        self.pending[key] = {"op": op, "document": document}
+    
+    # Отправка сообщения всем подписчикам; переполненная очередь заменяется на reload
+    def broadcast(self, event, data):
+        message = f"event: {event}\ndata: ".encode() + orjson.dumps(data, default=encode_mongo_value) + b"\n\n"
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(b"event: reload\ndata: {}\n\n")
+    
+    # Отправка накопленных изменений одним сообщением
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        if not self.subscribers:
+            return
+        
+        if len(pending) > LIVE_UPDATES_MAX_BATCH:
+            # Изменений больше, чем выгоднее передать по одному: клиенты перечитывают списки
+            self.broadcast("reload", {"collections": sorted({collection for collection, _ in pending})})
+            return
+        
+        changes = {collection: [] for collection in LIVE_UPDATES_COLLECTIONS}
+        for (collection, document_id), change in pending.items():
+            changes[collection].append({"_id": document_id, "op": change["op"], "document": change["document"]})
         
-        # Добавляем информацию о статье
-        for comment in comments:
-            article = db.articles.find_one({"_id": ObjectId(comment["article_id"])})
-            comment["article_title"] = article["title"] if article else "Неизвестно"
+        # Статьи - в виде записей таблицы управления контентом (без содержимого)
+        for item in changes["articles"]:
+            if item["document"]:
+                item["document"] = content_management_row(item["document"])
         
-        results["comments"] = to_str(comments)
+        # Комментарии - с заголовками статей, как в GET /comments/
+        await attach_article_titles([item["document"] for item in changes["comments"] if item["document"]])
+        
+        self.broadcast("changes", changes)
+
+live_updates = LiveUpdates()
+
+# Чтение change stream статей и комментариев; после сбоя поток открывается заново
+# с последнего полученного события (resume token)
+async def watch_live_updates():
+    if MONGO_DRIVER == "sync":
+        logger.warning("Live updates require the async driver")
+        return
+    
+    pipeline = [{"$match": {
+        "ns.coll": {"$in": list(LIVE_UPDATES_COLLECTIONS)},
+        "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+    }}]
+    resume_token = None
+    while True:
+        try:
+            async with await db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    op = {"replace": "update"}.get(change["operationType"], change["operationType"])
+                    live_updates.publish(change["ns"]["coll"], change["documentKey"]["_id"], op, change.get("fullDocument"))
+        except OperationFailure as e:
+            if e.code == 40573:  # Change stream недоступен: MongoDB запущена не как набор реплик
+                logger.error("Live updates require a MongoDB replica set")
+                return
+            logger.warning(f"Live updates change stream failed, reopening: {str(e)}")
+            await asyncio.sleep(LIVE_UPDATES_RETRY)
+        except PyMongoError as e:
+            logger.warning(f"Live updates change stream failed, reopening: {str(e)}")
+            await asyncio.sleep(LIVE_UPDATES_RETRY)
+
+# Периодическая отправка накопленных изменений
+async def flush_live_updates():
+    while True:
+        await asyncio.sleep(LIVE_UPDATES_INTERVAL)
+        try:
+            await live_updates.flush()
+        except Exception as e:
+            logger.error(f"Failed to send live updates: {str(e)}")
+
+# Поток изменений статей и комментариев (Server-Sent Events).
+# Событие changes: {"articles": [...], "comments": [...]}, элемент - {"_id", "op", "document"};
+# событие reload: изменений слишком много, списки нужно перечитать
+@app.get("/events")
+async def stream_events():
+    if not LIVE_UPDATES:
+        return JSONResponse({"error": "Live updates are disabled"}, status_code=503)
+    
+    queue = live_updates.subscribe()
+    
+    async def events():
+        try:
+            yield f"retry: {int(LIVE_UPDATES_KEEPALIVE * 1000)}\n\n".encode()
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), LIVE_UPDATES_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            live_updates.unsubscribe(queue)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # nginx не должен буферизовать поток
+    })
+
+#ИНДЕКСЫ И МИГРАЦИИ
+
+# Миграция 1: индексы под фильтры и сортировки эндпоинтов и уникальные ключи дедупликации
+async def migration_create_indexes(database):
+    # Списки статей: фильтр по статусу, автору, категории + сортировка новые первыми
+    await database.articles.create_index([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id")
+    await database.articles.create_index([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="status_created_at_id")
+    await database.articles.create_index([("author_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="author_id_created_at_id")
+    await database.articles.create_index([("category_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="category_id_created_at_id")
     
-    return results
+    # Списки комментариев: фильтр по статье и по статусу одобрения + сортировка новые первыми
+    await database.comments.create_index([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id")
+    await database.comments.create_index([("article_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="article_id_created_at_id")
+    await database.comments.create_index([("is_approved", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="is_approved_created_at_id")
+    
+    # Уникальные ключи, по которым эндпоинты создания отсекают дубликаты
+    await database.authors.create_index([("full_name", ASCENDING), ("email", ASCENDING)], name="full_name_email_unique", unique=True)
+    await database.categories.create_index([("name", ASCENDING)], name="name_unique", unique=True)
+    await database.articles.create_index([("title", ASCENDING), ("author_id", ASCENDING)], name="title_author_id_unique", unique=True)
+    await database.comments.create_index(
+        [("article_id", ASCENDING), ("author_name", ASCENDING), ("content", ASCENDING)],
+        name="article_id_author_name_content_unique",
+        unique=True
+    )
+
+# Миграция 2: текстовые индексы для поиска (русская морфология, заголовок важнее текста)
+async def migration_create_text_indexes(database):
+    await database.articles.create_index(
+        [("title", TEXT), ("content", TEXT)],
+        name="title_content_text",
+        weights={"title": 10, "content": 1},
+        default_language="russian",
+        language_override="search_language"
+    )
+    await database.comments.create_index(
+        [("content", TEXT)],
+        name="content_text",
+        default_language="russian",
+        language_override="search_language"
+    )
+
+# Миграция 5: индексы архива (те же списки и поиск, что у рабочих коллекций) и индекс
+# выборки статей для архивации
+async def migration_create_archive_indexes(database):
+    await database.articles.create_index([("status", ASCENDING), ("published_at", ASCENDING)], name="status_published_at")
+    
+    await database.articles_archive.create_index([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id")
+    await database.articles_archive.create_index([("author_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="author_id_created_at_id")
+    await database.articles_archive.create_index([("category_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="category_id_created_at_id")
+    await database.articles_archive.create_index(
+        [("title", TEXT), ("content", TEXT)],
+        name="title_content_text",
+        weights={"title": 10, "content": 1},
+        default_language="russian",
+        language_override="search_language"
+    )
+    
+    await database.comments_archive.create_index([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id")
+    await database.comments_archive.create_index([("article_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="article_id_created_at_id")
+    await database.comments_archive.create_index([("is_approved", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="is_approved_created_at_id")
+    await database.comments_archive.create_index(
+        [("content", TEXT)],
+        name="content_text",
+        default_language="russian",
+        language_override="search_language"
+    )
+
+# Размер пакета заполнения хэшей комментариев
+CONTENT_HASH_BATCH_SIZE = 1000
+
+# Миграция 7: дедупликация комментариев по хэшу вместо индекса по полному тексту.
+# Уникальный индекс частичный (только документы с content_hash), поэтому его можно
+# построить до заполнения хэшей. Старый индекс удаляется после заполнения.
+async def migration_comment_content_hash(database):
+    await database.comments.create_index(
+        [("content_hash", ASCENDING)],
+        name="content_hash_unique",
+        unique=True,
+        partialFilterExpression={"content_hash": {"$exists": True}}
+    )
+    
+    for collection_name in ("comments", "comments_archive"):
+        collection = database[collection_name]
+        filled = 0
+        while True:
+            batch = await collection.find(
+                {"content_hash": {"$exists": False}}, {"article_id": 1, "author_name": 1, "content": 1}
+            ).limit(CONTENT_HASH_BATCH_SIZE).to_list()
+            if not batch:
+                break
+            
+            await collection.bulk_write([
+                UpdateOne({"_id": doc["_id"]}, {"$set": {
+                    "content_hash": comment_content_hash(doc.get("article_id"), doc.get("author_name"), doc.get("content"))
+                }})
+                for doc in batch
+            ], ordered=False)
+            filled += len(batch)
+            logger.info(f"Comment content hashes: {collection_name} {filled} filled")
+    
+    try:
+        await database.comments.drop_index("article_id_author_name_content_unique")
+    except OperationFailure:
+        pass  # Индекса уже нет
+
+# Версионированный список миграций: (версия, описание, функция применения)
+MIGRATIONS = [
+    (1, "Create query and unique indexes", migration_create_indexes),
+    (2, "Create full-text search indexes", migration_create_text_indexes),
+    (3, "Build author activity read model", rebuild_author_activity),
+    (4, "Build daily analytics rollups", rebuild_analytics),
+    (5, "Create archive indexes", migration_create_archive_indexes),
+    (6, "Store author and category names in articles", backfill_article_names),
+    (7, "Deduplicate comments by content hash", migration_comment_content_hash),
+]
+
+# Применение всех миграций с версией больше текущей версии схемы
+async def run_migrations(database):
+    state = await database.schema_migrations.find_one({"_id": "schema"}) or {}
+    current_version = state.get("version", 0)
+    
+    for version, description, migrate in MIGRATIONS:
+        if version <= current_version:
+            continue
+        
+        logger.info(f"Applying migration {version}: {description}")
+        await migrate(database)
+        await database.schema_migrations.update_one(
+            {"_id": "schema"},
+            {"$set": {"version": version, "applied_at": datetime.now()}},
+            upsert=True
+        )
+        current_version = version
+    
+    logger.info(f"Database schema is at version {current_version}")
+    return current_version
+
+#ФОНОВАЯ МИГРАЦИЯ ССЫЛОК В ObjectId
+
+# Ссылочные поля, которые раньше хранились строками
+REFERENCE_FIELDS = {
+    "articles": ["author_id", "category_id"],
+    "comments": ["article_id"],
+}
+
+# Размер пакета фоновой миграции ссылок
+REFERENCES_MIGRATION_BATCH_SIZE = int(os.getenv("REFERENCES_MIGRATION_BATCH_SIZE", "1000"))
+
+# Проверка, завершена ли миграция ссылок
+async def references_migrated(database):
+    state = await database.schema_migrations.find_one({"_id": "object_id_references"}, {"done": 1})
+    return bool(state and state.get("done"))
+
+# Преобразование строковых ссылок в ObjectId пакетами по _id.
+# Прогресс (последний обработанный _id) сохраняется после каждого пакета, поэтому
+# прерванная миграция продолжается с места остановки.
+async def migrate_references(database, batch_size=REFERENCES_MIGRATION_BATCH_SIZE):
+    state = await database.schema_migrations.find_one({"_id": "object_id_references"}) or {}
+    if state.get("done"):
+        return
+    
+    for collection_name, fields in REFERENCE_FIELDS.items():
+        progress = state.get(collection_name) or {}
+        if progress.get("done"):
+            continue
+        
+        collection = database[collection_name]
+        last_id = progress.get("last_id")
+        processed = progress.get("processed", 0)
+        converted = progress.get("converted", 0)
+        total = await collection.estimated_document_count()
+        string_refs = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        
+        while True:
+            query = string_refs if last_id is None else {"$and": [string_refs, {"_id": {"$gt": last_id}}]}
+            batch = await collection.find(query, {field: 1 for field in fields}).sort("_id", 1).limit(batch_size).to_list()
+            if not batch:
+                break
+            
+            operations = []
+            for doc in batch:
+                update = {field: ObjectId(doc[field]) for field in fields
+                          if isinstance(doc.get(field), str) and ObjectId.is_valid(doc[field])}
+                if update:
+                    # Старое значение в фильтре: документ, измененный параллельно, не перезаписывается
+                    old_values = {field: doc[field] for field in update}
+                    operations.append(UpdateOne({"_id": doc["_id"], **old_values}, {"$set": update}))
+            
+            if operations:
+                result = await collection.bulk_write(operations, ordered=False)
+                converted += result.modified_count
+            
+            last_id = batch[-1]["_id"]
+            processed += len(batch)
+            await database.schema_migrations.update_one(
+                {"_id": "object_id_references"},
+                {"$set": {collection_name: {"last_id": last_id, "processed": processed, "converted": converted}}},
+                upsert=True
+            )
+            logger.info(f"References migration: {collection_name} {processed} processed, {converted} converted (~{total} documents)")
+        
+        await database.schema_migrations.update_one(
+            {"_id": "object_id_references"},
+            {"$set": {f"{collection_name}.done": True}},
+            upsert=True
+        )
+    
+    await database.schema_migrations.update_one(
+        {"_id": "object_id_references"},
+        {"$set": {"done": True, "completed_at": datetime.now()}},
+        upsert=True
+    )
+    logger.info("References migration completed")
+
+#АРХИВ СТАРОГО КОНТЕНТА
+# Опубликованные статьи старше ARCHIVE_AFTER_DAYS дней вместе с комментариями переносятся
+# в articles_archive и comments_archive. Рабочие коллекции и их индексы остаются небольшими;
+# списки и поиск по умолчанию читают только их, параметр include_archived добавляет архив.
+# Архивные документы доступны только для чтения; счетчики авторов, статистика и аналитика
+# по дням учитывают их как прежде.
+
+# Возраст публикации (в днях), после которого статья переносится в архив
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+
+# Число статей, переносимых за один пакет
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+# Период запуска архивации в фоне, ч (0 - только командой archive)
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "0"))
+
+# Перенос старых статей и их комментариев в архив пакетами.
+# Пакет сначала копируется (ReplaceOne с upsert), затем удаляется из рабочих коллекций,
+# поэтому прерванный перенос безопасно повторяется. Комментарии, добавленные к статье
+# во время переноса, остаются в рабочей коллекции.
+async def archive_old_content(database, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    # Архив хранит ссылки только как ObjectId
+    if not await references_migrated(database):
+        logger.warning("Archiving is postponed until the references migration completes")
+        return 0
+    
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    query = {"status": ArticleStatus.PUBLISHED.value, "published_at": {"$lt": cutoff}}
+    archived = 0
+    while True:
+        articles = await database.articles.find(query).sort("published_at", ASCENDING).limit(batch_size).to_list()
+        if not articles:
+            break
+        
+        article_ids = [article["_id"] for article in articles]
+        comments = await database.comments.find({"article_id": {"$in": article_ids}}).to_list()
+        archived_at = datetime.now()
+        
+        if comments:
+            await database.comments_archive.bulk_write([
+                ReplaceOne({"_id": comment["_id"]}, {**comment, "archived_at": archived_at}, upsert=True) for comment in comments
+            ], ordered=False)
+        await database.articles_archive.bulk_write([
+            ReplaceOne({"_id": article["_id"]}, {**article, "archived_at": archived_at}, upsert=True) for article in articles
+        ], ordered=False)
+        
+        if comments:
+            await database.comments.delete_many({"_id": {"$in": [comment["_id"] for comment in comments]}})
+        await database.articles.delete_many({"_id": {"$in": article_ids}})
+        await collections_changed("articles", "comments")
+        
+        archived += len(articles)
+        logger.info(f"Archived {archived} articles (last batch: {len(articles)} articles, {len(comments)} comments)")
+    
+    return archived
+
+# Периодическая архивация (выполняется только в одном процессе из нескольких воркеров)
+async def archive_periodically():
+    while True:
+        await run_exclusive("archive", archive_old_content, db)
+        await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
+
+# Запуск фоновой задачи с логированием ошибок
+async def run_background_job(name, job, *args):
+    try:
+        await job(*args)
+    except asyncio.CancelledError:
+        logger.info(f"Background job '{name}' cancelled")
+        raise
+    except Exception as e:
+        logger.error(f"Background job '{name}' failed: {str(e)}")
+
+# Идентификатор процесса для аренды фоновых задач (вычисляется после fork воркера)
+def process_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+# Время аренды фоновой задачи, с (продлевается, пока задача выполняется)
+LEASE_TTL = 60
+
+# Аренда задачи в коллекции leases: True, если задача свободна или аренда истекла
+async def acquire_lease(name):
+    now = datetime.now()
+    try:
+        await db.leases.update_one(
+            {"_id": name, "$or": [{"expires_at": {"$lt": now}}, {"owner": process_id()}]},
+            {"$set": {"owner": process_id(), "expires_at": now + timedelta(seconds=LEASE_TTL)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False  # Задачу выполняет другой процесс
+
+# Выполнение задачи только в одном процессе из нескольких воркеров
+async def run_exclusive(name, job, *args):
+    if not await acquire_lease(name):
+        logger.info(f"Background job '{name}' is running in another process")
+        return
+    
+    async def renew():
+        while True:
+            await asyncio.sleep(LEASE_TTL / 3)
+            await acquire_lease(name)
+    
+    renewal = asyncio.create_task(renew())
+    try:
+        await job(*args)
+    finally:
+        renewal.cancel()
+        await db.leases.delete_one({"_id": name, "owner": process_id()})
+
+# Формы запросов эндпоинтов: (эндпоинт, коллекция, фильтр, сортировка)
+QUERY_SHAPES = [
+    ("GET /articles/", "articles", {}, NEWEST_FIRST),
+    ("GET /articles/?status=", "articles", {"status": ArticleStatus.PUBLISHED.value}, NEWEST_FIRST),
+    ("GET /articles/?author_id=", "articles", {"author_id": ""}, NEWEST_FIRST),
+    ("GET /articles/?category_id=", "articles", {"category_id": ""}, NEWEST_FIRST),
+    ("GET /content-management/", "articles", {}, NEWEST_FIRST),
+    ("GET /comments/", "comments", {}, NEWEST_FIRST),
+    ("GET /comments/?article_id=", "comments", {"article_id": ""}, NEWEST_FIRST),
+    ("GET /comments/?is_approved=", "comments", {"is_approved": False}, NEWEST_FIRST),
+    ("GET /comments/moderation-queue", "comments", {"is_approved": False}, OLDEST_FIRST),
+    ("GET /author-activity/", "author_activity", {}, [("_id", ASCENDING)]),
+    ("GET /analytics/timeseries", "analytics_daily", {"scope": "all", "key": "", "day": {"$gte": datetime(2000, 1, 1)}}, None),
+    ("POST /authors/ (duplicate lookup)", "authors", {"full_name": "", "email": ""}, None),
+    ("POST /categories/ (duplicate lookup)", "categories", {"name": ""}, None),
+    ("POST /articles/ (duplicate lookup)", "articles", {"title": "", "author_id": ""}, None),
+    ("POST /comments/ (duplicate lookup)", "comments", {"content_hash": ""}, None),
+    ("GET /search/ (articles)", "articles", {"$text": {"$search": "статья"}}, None),
+    ("GET /search/ (comments)", "comments", {"$text": {"$search": "статья"}}, None),
+    ("GET /articles/?include_archived (archive)", "articles_archive", {}, NEWEST_FIRST),
+    ("GET /comments/?include_archived (archive)", "comments_archive", {}, NEWEST_FIRST),
+    ("archive (article selection)", "articles", {"status": ArticleStatus.PUBLISHED.value, "published_at": {"$lt": datetime(2000, 1, 1)}}, [("published_at", ASCENDING)]),
+]
+
+# Рекурсивный сбор названий стадий плана выполнения запроса
+def plan_stages(plan):
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+# Отчет explain(): какие формы запросов выполняются полным сканированием коллекции (COLLSCAN)
+async def explain_query_shapes(database):
+    report = []
+    for endpoint, collection, query, sort in QUERY_SHAPES:
+        cursor = database[collection].find(query).limit(DEFAULT_PAGE_SIZE)
+        if sort:
+            cursor = cursor.sort(sort)
+        
+        stages = plan_stages((await cursor.explain())["queryPlanner"]["winningPlan"])
+        report.append({
+            "endpoint": endpoint,
+            "collection": collection,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages
+        })
+    return report
+
+#КОМАНДЫ ОБСЛУЖИВАНИЯ
+
+# Выполнение команды обслуживания базы данных с отдельным подключением к MongoDB
+async def run_command(command, fix=False):
+    await connect_mongo()
+    try:
+        if command == "migrate":
+            await run_migrations(db)
+        elif command == "migrate-references":
+            await migrate_references(db)
+        elif command == "rebuild-author-activity":
+            await rebuild_author_activity(db)
+        elif command == "rebuild-analytics":
+            await rebuild_analytics(db)
+        elif command == "archive":
+            await run_exclusive("archive", archive_old_content, db)
+        elif command == "check-names":
+            await check_article_names(db, fix=fix)
+        elif command == "explain":
+            for item in await explain_query_shapes(db):
+                marker = "COLLSCAN" if item["collscan"] else "ok"
+                print(f"{marker:<9} {item['endpoint']:<40} {item['collection']:<11} {' <- '.join(item['stages'])}")
+    finally:
+        await close_mongo()
 
 #ЗАПУСК СЕРВЕРА
 
 if __name__ == "__main__":
-    # Запуск сервера Uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)  # Сервер доступен на всех сетевых интерфейсах
\ No newline at end of file
+    # Команды: serve (по умолчанию) - запуск сервера, migrate - применение миграций,
+    # explain - отчет по планам запросов, migrate-references - преобразование ссылок в ObjectId,
+    # rebuild-author-activity - пересчет витрины активности авторов,
+    # rebuild-analytics - пересчет аналитики по дням, archive - перенос старых статей в архив,
+    # check-names - проверка имен авторов и категорий в статьях (--fix - исправление)
+    parser = argparse.ArgumentParser(description="Blog Admin Panel")
+    parser.add_argument("command", nargs="?", default="serve",
+                        choices=["serve", "migrate", "explain", "migrate-references", "rebuild-author-activity", "rebuild-analytics", "archive", "check-names"])
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")),
+                        help="Число процессов-воркеров сервера")
+    parser.add_argument("--fix", action="store_true", help="check-names: исправить найденные расхождения")
+    args = parser.parse_args()
+    
+    if args.command == "serve" and args.workers > 1:
+        # Миграции применяются один раз до запуска воркеров, воркеры их пропускают.
+        # При ошибке воркеры повторяют миграции при запуске (под арендой)
+        if RUN_MIGRATIONS_ON_STARTUP:
+            try:
+                asyncio.run(run_command("migrate"))
+                os.environ["RUN_MIGRATIONS_ON_STARTUP"] = "0"
+            except Exception as e:
+                logger.error(f"Failed to apply migrations: {str(e)}")
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=args.workers)
+    elif args.command == "serve":
+        # Запуск сервера Uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)  # Сервер доступен на всех сетевых интерфейсах
+    else:
+        asyncio.run(run_command(args.command, fix=args.fix))
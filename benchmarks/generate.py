@@ -0,0 +1,217 @@
+# Генератор синтетических данных блога для бенчмарков
+#
+# Заполняет базу авторами, категориями, статьями и комментариями в заданных объемах,
+# заполняет витрину активности авторов и применяет миграции (индексы).
+# Документы имеют ту же форму, что и создаваемые через API (ссылки - ObjectId), данные
+# детерминированы параметром --seed, поэтому прогоны разных версий кода сравнимы.
+#
+# Запуск:
+#   python benchmarks/generate.py --authors 1000 --categories 50 --articles 500000 --comments 5000000 --drop
+#   python benchmarks/generate.py --mongo-url mongodb://localhost:27017/ --database blog_admin_db
+# Требуется: локальный mongod
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+# Словарь для текстов статей и комментариев (русский, как у настоящего контента)
+WORDS = (
+    "блог статья автор читатель новости обзор история мнение событие исследование "
+    "технологии наука культура спорт путешествия кухня музыка кино книга игра "
+    "город страна мир время год день человек жизнь работа проект команда "
+    "интересный важный новый большой лучший простой быстрый сложный главный последний"
+).split()
+
+# Статусы статей и их доли
+STATUSES = [("Опубликовано", 0.6), ("Черновик", 0.25), ("На модерации", 0.15)]
+
+# Коллекции, которые создает генератор
+COLLECTIONS = ["authors", "categories", "articles", "comments", "author_activity", "analytics_daily"]
+
+
+# Случайный текст из words слов
+def text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+# Вставка документов пакетами по batch_size (память не зависит от объема данных)
+def insert_batches(collection, documents, batch_size, total, log):
+    batch = []
+    inserted = 0
+    started = time.perf_counter()
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+            log(f"  {collection.name}: {inserted}/{total} ({inserted / (time.perf_counter() - started):.0f} док/с)")
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+# Заполнение базы (синхронная база pymongo или mongomock)
+def generate(database, authors, categories, articles, comments, seed=1, batch_size=10000,
+             content_words=120, days=730, log=print):
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=days)
+
+    author_docs = [
+        {
+            "_id": ObjectId(),
+            "full_name": f"Автор {i}",
+            "email": f"author{i}@example.com",
+            "registration_date": start + timedelta(seconds=rng.uniform(0, days * 86400)),
+        }
+        for i in range(authors)
+    ]
+    author_ids = [author["_id"] for author in author_docs]
+    insert_batches(database.authors, iter(author_docs), batch_size, authors, log)
+
+    category_ids = [ObjectId() for _ in range(categories)]
+    insert_batches(database.categories, (
+        {"_id": category_id, "name": f"Категория {i}", "description": text(rng, 8)}
+        for i, category_id in enumerate(category_ids)
+    ), batch_size, categories, log)
+
+    # Статьи создаются равномерно по времени; авторы и категории выбираются неравномерно
+    # (у части авторов и категорий статей гораздо больше, чем у остальных)
+    statuses, weights = zip(*STATUSES)
+    step = days * 86400 / max(articles, 1)
+    article_ids = []
+    article_dates = []
+    article_authors = []  # Индекс автора каждой статьи
+    published_count = [0] * authors
+    comments_count = [0] * authors
+
+    def article_documents():
+        for i in range(articles):
+            article_id = ObjectId()
+            created_at = start + timedelta(seconds=i * step + rng.uniform(0, step))
+            status = rng.choices(statuses, weights)[0]
+            author = int(authors * rng.random() ** 2)
+            category = int(categories * rng.random() ** 2)
+            article_ids.append(article_id)
+            article_dates.append(created_at)
+            article_authors.append(author)
+            published_count[author] += status == "Опубликовано"
+            yield {
+                "_id": article_id,
+                "title": f"{text(rng, 4).capitalize()} {i}",
+                "content": text(rng, rng.randint(content_words // 2, content_words * 3 // 2)),
+                "author_id": author_ids[author],
+                "category_id": category_ids[category],
+                "author_name": author_docs[author]["full_name"],
+                "category_name": f"Категория {category}",
+                "status": status,
+                "created_at": created_at,
+                "updated_at": created_at,
+                "published_at": created_at + timedelta(hours=rng.uniform(0, 48)) if status == "Опубликовано" else None,
+                "version": 1,
+            }
+
+    insert_batches(database.articles, article_documents(), batch_size, articles, log)
+
+    # Комментарии чаще достаются свежим статьям; около 30% ждут модерации
+    from main import comment_content_hash
+
+    def comment_documents():
+        for i in range(comments):
+            index = articles - 1 - int(articles * rng.random() ** 3)
+            created_at = min(article_dates[index] + timedelta(hours=rng.expovariate(1 / 24)), now)
+            comments_count[article_authors[index]] += 1
+            author_name = f"Читатель {rng.randint(0, 50000)}"
+            content = f"{text(rng, rng.randint(5, 40)).capitalize()} #{i}"
+            yield {
+                "article_id": article_ids[index],
+                "author_name": author_name,
+                "content": content,
+                "content_hash": comment_content_hash(article_ids[index], author_name, content),
+                "created_at": created_at,
+                "is_approved": rng.random() < 0.7,
+            }
+
+    if articles:
+        insert_batches(database.comments, comment_documents(), batch_size, comments, log)
+
+    # Витрина активности авторов (та же форма, что у init_author_activity в main.py)
+    insert_batches(database.author_activity, (
+        {
+            "_id": str(author["_id"]),
+            "author_name": author["full_name"],
+            "published_articles_count": published_count[i],
+            "total_comments_count": comments_count[i],
+            "email": author["email"],
+            "registration_date": author["registration_date"],
+        }
+        for i, author in enumerate(author_docs)
+    ), batch_size, authors, log)
+
+
+# Индексы и служебные отметки после заполнения
+async def prepare(database, migrate=True):
+    import main
+
+    if migrate:
+        await main.run_migrations(main.ThreadedDatabase(database))
+
+    # Ссылки уже записаны как ObjectId - фоновая миграция ссылок не нужна
+    database.schema_migrations.update_one(
+        {"_id": "object_id_references"},
+        {"$set": {"done": True, "completed_at": datetime.now()}},
+        upsert=True,
+    )
+    if not migrate:
+        # Без миграций аналитика по дням строится отдельно (уже с отметкой о ссылках)
+        await main.rebuild_analytics(main.ThreadedDatabase(database))
+    # Новые версии коллекций: ETag, выданные до заполнения, больше не совпадут
+    for name in COLLECTIONS:
+        database.collection_versions.update_one(
+            {"_id": name}, {"$inc": {"version": 1}, "$currentDate": {"updated_at": True}}, upsert=True
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заполнение базы синтетическими данными блога")
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017/"))
+    parser.add_argument("--database", default="blog_admin_db")
+    parser.add_argument("--authors", type=int, default=1000)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--articles", type=int, default=500000)
+    parser.add_argument("--comments", type=int, default=5000000)
+    parser.add_argument("--content-words", type=int, default=120, help="Средняя длина статьи в словах")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--drop", action="store_true", help="Удалить существующую базу перед заполнением")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+
+    client = MongoClient(args.mongo_url)
+    if args.drop:
+        client.drop_database(args.database)
+    database = client[args.database]
+
+    started = time.perf_counter()
+    generate(database, args.authors, args.categories, args.articles, args.comments,
+             seed=args.seed, batch_size=args.batch_size, content_words=args.content_words)
+    asyncio.run(prepare(database))
+    print(f"Готово за {time.perf_counter() - started:.1f} с: " + ", ".join(
+        f"{name} {database[name].estimated_document_count()}" for name in COLLECTIONS
+    ))
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
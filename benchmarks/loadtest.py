@@ -0,0 +1,215 @@
+# Нагрузочный тест: пропускная способность API в режимах драйвера sync и async
+#
+# Запросы отправляются напрямую в ASGI-приложение (httpx.ASGITransport), вместо MongoDB
+# используется mongomock с искусственной сетевой задержкой на каждое обращение к базе.
+# В режиме sync задержка блокирует поток пула (как MongoClient), в режиме async - нет
+# (как AsyncMongoClient).
+#
+# Запуск:
+#   python benchmarks/loadtest.py --concurrency 100 --duration 10 --latency-ms 5
+# Требуется: pip install mongomock httpx
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+# Смесь запросов нагрузочного теста
+WORKLOAD = [
+    "/articles/?limit=50",
+    "/articles/?limit=50&status=Опубликовано",
+    "/comments/?limit=50",
+    "/authors/",
+    "/categories/",
+    "/content-management/?limit=50",
+    "/statistics/",
+]
+
+
+# Курсор mongomock с блокирующей задержкой при чтении
+class SlowSyncCursor:
+    def __init__(self, cursor, latency):
+        self._cursor = cursor
+        self._latency = latency
+
+    def __getattr__(self, name):
+        method = getattr(self._cursor, name)
+
+        def chain(*args, **kwargs):
+            self._cursor = method(*args, **kwargs)
+            return self
+        return chain
+
+    def __iter__(self):
+        time.sleep(self._latency)
+        return iter(self._cursor)
+
+
+# Коллекция mongomock с блокирующей задержкой на каждое обращение (модель MongoClient)
+class SlowSyncCollection:
+    def __init__(self, collection, latency):
+        self._collection = collection
+        self._latency = latency
+
+    def find(self, *args, **kwargs):
+        return SlowSyncCursor(self._collection.find(*args, **kwargs), self._latency)
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        def call(*args, **kwargs):
+            time.sleep(self._latency)
+            return method(*args, **kwargs)
+        return call
+
+
+# Курсор mongomock с неблокирующей задержкой при чтении
+class SlowAsyncCursor:
+    def __init__(self, cursor, latency):
+        self._cursor = cursor
+        self._latency = latency
+
+    def __getattr__(self, name):
+        method = getattr(self._cursor, name)
+
+        def chain(*args, **kwargs):
+            self._cursor = method(*args, **kwargs)
+            return self
+        return chain
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(self._latency)
+        return list(itertools.islice(self._cursor, length))
+
+
+# Коллекция mongomock с неблокирующей задержкой на каждое обращение (модель AsyncMongoClient)
+class SlowAsyncCollection:
+    def __init__(self, collection, latency):
+        self._collection = collection
+        self._latency = latency
+
+    def find(self, *args, **kwargs):
+        return SlowAsyncCursor(self._collection.find(*args, **kwargs), self._latency)
+
+    async def aggregate(self, *args, **kwargs):
+        await asyncio.sleep(self._latency)
+        return SlowAsyncCursor(self._collection.aggregate(*args, **kwargs), 0)
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            await asyncio.sleep(self._latency)
+            return method(*args, **kwargs)
+        return call
+
+
+# База данных, возвращающая коллекции с задержкой
+class SlowDatabase:
+    def __init__(self, database, collection_class, latency):
+        self._database = database
+        self._collection_class = collection_class
+        self._latency = latency
+
+    def __getitem__(self, name):
+        return self._collection_class(self._database[name], self._latency)
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+# Заполнение базы синтетическими данными
+def seed(database, articles_count):
+    author_ids = database.authors.insert_many([
+        {"full_name": f"Автор {i}", "email": f"author{i}@example.com"} for i in range(20)
+    ]).inserted_ids
+    category_ids = database.categories.insert_many([{"name": f"Категория {i}"} for i in range(5)]).inserted_ids
+    statuses = ["Черновик", "На модерации", "Опубликовано"]
+    article_ids = database.articles.insert_many([
+        {
+            "title": f"Статья {i}",
+            "content": "Текст статьи " * 20,
+            "author_id": str(random.choice(author_ids)),
+            "category_id": str(random.choice(category_ids)),
+            "status": random.choice(statuses),
+            "created_at": i,
+        }
+        for i in range(articles_count)
+    ]).inserted_ids
+    database.comments.insert_many([
+        {
+            "article_id": str(random.choice(article_ids)),
+            "author_name": f"Читатель {i}",
+            "content": "Комментарий",
+            "is_approved": i % 2 == 0,
+            "created_at": i,
+        }
+        for i in range(articles_count * 2)
+    ])
+
+
+# Прогон нагрузки: concurrency параллельных клиентов в течение duration секунд
+async def run_load(app, concurrency, duration):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    deadline = time.perf_counter() + duration
+    completed = 0
+    errors = 0
+
+    async def worker(client):
+        nonlocal completed, errors
+        for path in itertools.cycle(random.sample(WORKLOAD, len(WORKLOAD))):
+            if time.perf_counter() >= deadline:
+                return
+            response = await client.get(path)
+            if response.status_code == 200:
+                completed += 1
+            else:
+                errors += 1
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return completed / elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение режимов драйвера sync и async")
+    parser.add_argument("--concurrency", type=int, default=100, help="Число параллельных клиентов")
+    parser.add_argument("--duration", type=float, default=10, help="Длительность прогона каждого режима, с")
+    parser.add_argument("--latency-ms", type=float, default=5, help="Задержка одного обращения к базе, мс")
+    parser.add_argument("--articles", type=int, default=50)
+    args = parser.parse_args()
+
+    import logging
+    import mongomock
+    import main as app_module
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    app_module.statistics_cache.ttl = 0  # Статистика пересчитывается на каждый запрос
+
+    raw_db = mongomock.MongoClient()["blog_admin_bench"]
+    seed(raw_db, args.articles)
+    latency = args.latency_ms / 1000
+
+    modes = {
+        "sync": app_module.ThreadedDatabase(SlowDatabase(raw_db, SlowSyncCollection, latency)),
+        "async": SlowDatabase(raw_db, SlowAsyncCollection, latency),
+    }
+
+    for mode, database in modes.items():
+        app_module.db = database
+        rps, errors = asyncio.run(run_load(app_module.app, args.concurrency, args.duration))
+        print(f"{mode:<6} запросов/с: {rps:8.1f}  ошибок: {errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# Бенчмарк: количество обращений к MongoDB при получении списка статей (GET /articles/)
+#
+# Сравнивает старую реализацию (find_one на автора и категорию для каждой статьи)
+# с текущей (имена автора и категории хранятся в статьях - один запрос find).
+#
+# Запуск:
+#   python benchmarks/round_trips.py --articles 2000
+#   python benchmarks/round_trips.py --mongo-url mongodb://localhost:27017/
+# Без --mongo-url используется mongomock (pip install mongomock).
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+# Методы коллекции, каждый вызов которых означает обращение к базе данных
+QUERY_METHODS = {"find", "find_one", "aggregate", "count_documents", "insert_one", "update_one", "delete_one"}
+
+
+# Обёртка над коллекцией, подсчитывающая обращения к базе
+class CountingCollection:
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in QUERY_METHODS:
+            return attr
+
+        def wrapper(*args, **kwargs):
+            self._counter[name] = self._counter.get(name, 0) + 1
+            return attr(*args, **kwargs)
+        return wrapper
+
+
+# Обёртка над базой данных, возвращающая считающие коллекции
+class CountingDatabase:
+    def __init__(self, database):
+        self._database = database
+        self.counter = {}
+
+    def __getattr__(self, name):
+        return CountingCollection(self._database[name], self.counter)
+
+    def __getitem__(self, name):
+        return CountingCollection(self._database[name], self.counter)
+
+    def total(self):
+        return sum(self.counter.values())
+
+
+# Заполнение базы синтетическими данными
+def seed(database, authors_count, categories_count, articles_count):
+    for name in ("authors", "categories", "articles"):
+        database[name].delete_many({})
+
+    author_ids = database.authors.insert_many([
+        {"full_name": f"Автор {i}", "email": f"author{i}@example.com"} for i in range(authors_count)
+    ]).inserted_ids
+    category_ids = database.categories.insert_many([
+        {"name": f"Категория {i}"} for i in range(categories_count)
+    ]).inserted_ids
+
+    # Статьи хранят имена автора и категории (как после миграции 6)
+    def article(i):
+        author = random.randrange(authors_count)
+        category = random.randrange(categories_count)
+        return {
+            "title": f"Статья {i}",
+            "content": "Текст статьи " * 20,
+            "author_id": str(author_ids[author]),
+            "category_id": str(category_ids[category]),
+            "author_name": f"Автор {author}",
+            "category_name": f"Категория {category}",
+            "status": "Опубликовано",
+            "created_at": i,
+        }
+
+    database.articles.insert_many([article(i) for i in range(articles_count)])
+
+
+# Реализация GET /articles/ до оптимизации (N+1 запросов)
+def legacy_get_articles(database, limit):
+    articles = list(database.articles.find({}).sort([("created_at", -1), ("_id", -1)]).limit(limit))
+    for article in articles:
+        author = database.authors.find_one({"_id": ObjectId(article["author_id"])})
+        article["author_name"] = author["full_name"] if author else "Неизвестно"
+        category = database.categories.find_one({"_id": ObjectId(article["category_id"])})
+        article["category_name"] = category["name"] if category else "Неизвестно"
+    return articles
+
+
+def measure(label, database, func):
+    database.counter.clear()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<10} статей: {len(result):>6}  обращений к БД: {database.total():>6}  "
+          f"время: {elapsed * 1000:8.1f} мс  {database.counter}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подсчёт обращений к MongoDB в GET /articles/")
+    parser.add_argument("--mongo-url", default=None, help="URL MongoDB (по умолчанию mongomock)")
+    parser.add_argument("--authors", type=int, default=100)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--articles", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=1000, help="Размер страницы GET /articles/")
+    args = parser.parse_args()
+
+    if args.mongo_url:
+        from pymongo import MongoClient
+        raw_db = MongoClient(args.mongo_url)["blog_admin_bench"]
+    else:
+        import mongomock
+        raw_db = mongomock.MongoClient()["blog_admin_bench"]
+
+    import orjson
+    import main as app_module
+
+    seed(raw_db, args.authors, args.categories, args.articles)
+    database = CountingDatabase(raw_db)
+    app_module.db = app_module.ThreadedDatabase(database)
+
+    before = measure("до", database, lambda: legacy_get_articles(database, args.limit))
+    after = measure("после", database, lambda: orjson.loads(asyncio.run(app_module.get_articles(
+        status=None, author_id=None, category_id=None, limit=args.limit, after=None, fields=None,
+        include_archived=False)).body))
+
+    # Формат ответа не должен измениться
+    assert [a["author_name"] for a in before] == [a["author_name"] for a in after]
+    assert [a["category_name"] for a in before] == [a["category_name"] for a in after]
+
+
+if __name__ == "__main__":
+    main()
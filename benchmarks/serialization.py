@@ -0,0 +1,100 @@
+# Микробенчмарк сериализации ответа со списком статей
+#
+# Сравнивает прежний путь (рекурсивный to_str + jsonable_encoder FastAPI + json.dumps)
+# с MongoJSONResponse (orjson, ObjectId и datetime кодируются за один проход).
+# Для каждого пути измеряются процессорное время и пиковое потребление памяти (tracemalloc).
+#
+# Запуск:
+#   python benchmarks/serialization.py --articles 10000 --repeat 5
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+
+# Прежнее рекурсивное преобразование ObjectId в строки
+def to_str(data):
+    if isinstance(data, list):
+        return [to_str(item) for item in data]
+    if isinstance(data, dict):
+        return {k: str(v) if isinstance(v, ObjectId) else to_str(v) for k, v in data.items()}
+    return data
+
+
+# Документы статей в том виде, в котором их возвращает драйвер MongoDB
+def make_articles(count):
+    now = datetime.now()
+    return [
+        {
+            "_id": ObjectId(),
+            "title": f"Статья {i}",
+            "content": "Текст статьи. " * 80,
+            "author_id": ObjectId(),
+            "category_id": ObjectId(),
+            "status": "Опубликовано",
+            "created_at": now - timedelta(minutes=i),
+            "updated_at": now - timedelta(minutes=i),
+            "published_at": now - timedelta(minutes=i),
+            "author_name": f"Автор {i % 100}",
+            "category_name": f"Категория {i % 10}",
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_render(articles):
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    return JSONResponse(jsonable_encoder(to_str(articles))).body
+
+
+def fast_render(articles):
+    from main import MongoJSONResponse
+    return MongoJSONResponse(articles).body
+
+
+# Процессорное время (лучшее из repeat прогонов) и пиковая дополнительная память одного прогона
+def measure(render, articles, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.process_time()
+        body = render(articles)
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    render(articles)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение путей сериализации ответа")
+    parser.add_argument("--articles", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    import orjson
+
+    articles = make_articles(args.articles)
+    results = {}
+    for label, render in (("to_str + jsonable_encoder", legacy_render), ("MongoJSONResponse", fast_render)):
+        cpu, peak, body = measure(render, articles, args.repeat)
+        results[label] = body
+        print(f"{label:<26} CPU: {cpu * 1000:8.1f} мс  пик памяти: {peak / 2 ** 20:7.1f} МБ  ответ: {len(body) / 2 ** 20:5.1f} МБ")
+
+    # Оба пути должны давать одинаковый JSON
+    legacy, fast = (orjson.loads(body) for body in results.values())
+    assert legacy == fast
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# Проверка объединения одновременных аналитических запросов (single-flight)
+#
+# N одновременных вызовов GET /statistics/ при пустом кэше должны выполнить одно вычисление
+# статистики: первый вызов его запускает, остальные N-1 получают тот же результат.
+# Дополнительно проверяется, что исключение вычисления получают все ожидающие запросы
+# и что отмена одного из ожидающих не отменяет общее вычисление.
+# Любое нарушение завершает скрипт с AssertionError.
+#
+# Запуск:
+#   python benchmarks/single_flight.py --callers 50
+#   python benchmarks/single_flight.py --mongo-url mongodb://localhost:27017/
+# Без --mongo-url используется mongomock (pip install mongomock).
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from generate import generate
+
+
+# Вычисление, которое считает свои запуски и держит запросы в полете delay секунд
+class CountedComputation:
+    def __init__(self, compute, delay):
+        self.compute = compute
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return await self.compute()
+
+
+# N одновременных GET /statistics/ при пустом кэше -> одно вычисление
+async def check_statistics(app_module, callers, delay):
+    counted = CountedComputation(app_module.compute_statistics, delay)
+    app_module.compute_statistics = counted
+    app_module.analytics_flight = app_module.SingleFlight()
+    app_module.statistics_cache.clear()
+
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(app_module.get_statistics() for _ in range(callers)))
+    elapsed = time.perf_counter() - started
+
+    stats = app_module.analytics_flight.stats()
+    print(f"statistics: {callers} вызовов, вычислений {counted.calls}, {stats}, {elapsed * 1000:.1f} мс")
+    assert counted.calls == 1
+    assert stats["computations"] == 1
+    assert stats["shared"] == callers - 1
+    assert stats["in_flight"] == 0
+    assert len({response.body for response in responses}) == 1
+
+
+# Исключение вычисления получают все ожидающие запросы
+async def check_exception(app_module, callers, delay):
+    flight = app_module.SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(delay)
+        raise RuntimeError("computation failed")
+
+    results = await asyncio.gather(*(flight.run("failing", failing) for _ in range(callers)), return_exceptions=True)
+    print(f"exception: {sum(isinstance(r, RuntimeError) for r in results)}/{callers} получили исключение, {flight.stats()}")
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.stats() == {"in_flight": 0, "computations": 1, "shared": callers - 1}
+
+
+# Отмена одного ожидающего (например, клиент закрыл соединение) не отменяет вычисление
+async def check_cancellation(app_module, callers, delay):
+    flight = app_module.SingleFlight()
+    finished = []
+
+    async def slow():
+        await asyncio.sleep(delay)
+        finished.append(True)
+        return 42
+
+    waiters = [asyncio.ensure_future(flight.run("slow", slow)) for _ in range(callers)]
+    await asyncio.sleep(delay / 10)
+    waiters[0].cancel()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    print(f"cancellation: первый отменен, остальные получили {set(results[1:])}, {flight.stats()}")
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert results[1:] == [42] * (callers - 1)
+    assert finished == [True]
+    assert flight.stats()["computations"] == 1
+
+
+async def run(app_module, callers, delay):
+    await check_statistics(app_module, callers, delay)
+    await check_exception(app_module, callers, delay)
+    await check_cancellation(app_module, callers, delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка объединения одновременных аналитических запросов")
+    parser.add_argument("--mongo-url", default=None, help="URL MongoDB (по умолчанию mongomock)")
+    parser.add_argument("--callers", type=int, default=50, help="Число одновременных вызовов")
+    parser.add_argument("--delay", type=float, default=0.05, help="Дополнительная длительность вычисления, с")
+    args = parser.parse_args()
+
+    if args.mongo_url:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongo_url)
+        client.drop_database("blog_admin_bench")
+        raw_db = client["blog_admin_bench"]
+    else:
+        import mongomock
+        raw_db = mongomock.MongoClient()["blog_admin_bench"]
+
+    import main as app_module
+
+    generate(raw_db, 20, 5, 200, 1000, batch_size=1000, content_words=20, log=lambda message: None)
+    app_module.db = app_module.ThreadedDatabase(raw_db)
+    asyncio.run(run(app_module, args.callers, args.delay))
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+# Сценарная нагрузка на все эндпоинты API с отчетом p50/p99 и пропускной способности
+#
+# Смесь запросов имитирует работу админ-панели: в основном чтение списков, статей и
+# статистики (в том числе повторные запросы браузера с If-None-Match), реже создание и
+# модерация комментариев, правка статей, пакетные операции и выгрузки.
+#
+# Режимы:
+#   python benchmarks/workload.py                      # в памяти: mongomock + ASGI-приложение
+#     (mongomock не поддерживает $text, поэтому /search/ в этом режиме отвечает ошибкой)
+#   python benchmarks/workload.py --url http://localhost:8000 --duration 60 --concurrency 50
+#     (запустите сервер с WRITE_RATE_LIMIT=0 и COMMENT_RATE_LIMIT=0, иначе записи сверх
+#     предела получат 429 и попадут в ошибки)
+#
+# Результаты можно сохранить и сравнить с прошлым прогоном:
+#   python benchmarks/workload.py --save baseline.json
+#   python benchmarks/workload.py --baseline baseline.json
+#
+# Для прогона на большой базе заполните ее заранее: python benchmarks/generate.py
+# Требуется: pip install httpx (и mongomock для режима в памяти)
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from generate import WORDS, generate, prepare
+
+
+# Данные, на которые ссылаются запросы (выбираются из базы перед прогоном)
+class Pool:
+    def __init__(self, rng):
+        self.rng = rng
+        self.articles = []
+        self.authors = []
+        self.categories = []
+        self.comments = []
+        self.cursor = None  # Курсор второй страницы статей
+        self.counter = 0
+
+    def unique(self):
+        self.counter += 1
+        return f"{os.getpid()}-{time.time_ns()}-{self.counter}"
+
+    def article(self):
+        return self.rng.choice(self.articles)
+
+    def new_article(self):
+        return {
+            "title": f"Нагрузочная статья {self.unique()}",
+            "content": " ".join(self.rng.choice(WORDS) for _ in range(80)),
+            "author_id": self.rng.choice(self.authors),
+            "category_id": self.rng.choice(self.categories),
+            "status": self.rng.choice(["Черновик", "Опубликовано"]),
+        }
+
+    def new_comment(self):
+        return {
+            "article_id": self.article(),
+            "author_name": f"Читатель {self.rng.randint(0, 50000)}",
+            "content": f"Комментарий {self.unique()}",
+        }
+
+
+# Операции сценария: (эндпоинт для отчета, вес в смеси, функция запроса)
+def operations():
+    return [
+        ("GET /articles/", 15, lambda c, p: c.get("/articles/", params={"limit": 50})),
+        ("GET /articles/ (next page)", 5, lambda c, p: c.get("/articles/", params={"limit": 50, "after": p.cursor})),
+        ("GET /articles/?status", 5, lambda c, p: c.get("/articles/", params={"limit": 50, "status": "Опубликовано"})),
+        ("GET /articles/?author_id", 4, lambda c, p: c.get("/articles/", params={"limit": 50, "author_id": p.rng.choice(p.authors)})),
+        ("GET /articles/?fields", 3, lambda c, p: c.get("/articles/", params={"limit": 100, "fields": "title,status"})),
+        ("GET /articles/{id}", 12, lambda c, p: c.get(f"/articles/{p.article()}")),
+        ("GET /authors/", 4, lambda c, p: c.get("/authors/")),
+        ("GET /categories/", 4, lambda c, p: c.get("/categories/")),
+        ("GET /bootstrap", 3, lambda c, p: c.get("/bootstrap", params={"views": "authors,categories,articles"})),
+        ("GET /comments/", 6, lambda c, p: c.get("/comments/", params={"limit": 50})),
+        ("GET /comments/?article_id", 6, lambda c, p: c.get("/comments/", params={"article_id": p.article()})),
+        ("GET /comments/?is_approved", 3, lambda c, p: c.get("/comments/", params={"limit": 50, "is_approved": "false"})),
+        ("GET /comments/moderation-queue", 3, lambda c, p: c.get("/comments/moderation-queue", params={"limit": 50})),
+        ("GET /content-management/", 6, lambda c, p: c.get("/content-management/", params={"limit": 50})),
+        ("GET /statistics/", 8, lambda c, p: c.get("/statistics/")),
+        ("GET /author-activity/", 3, lambda c, p: c.get("/author-activity/")),
+        ("GET /analytics/timeseries", 2, lambda c, p: c.get("/analytics/timeseries", params={"granularity": p.rng.choice(["day", "week", "month"])})),
+        ("GET /analytics/...?author_id", 1, lambda c, p: c.get("/analytics/timeseries", params={"granularity": "week", "author_id": p.rng.choice(p.authors)})),
+        ("GET /search/", 4, lambda c, p: c.get("/search/", params={"query": p.rng.choice(WORDS)})),
+        ("GET /cache-stats/", 0.5, lambda c, p: c.get("/cache-stats/")),
+        ("GET /metrics", 0.5, lambda c, p: c.get("/metrics")),
+        ("GET /comments/export", 0.5, lambda c, p: c.get("/comments/export", params={"article_id": p.article(), "format": "ndjson"})),
+        ("GET /content-management/export", 0.1, lambda c, p: c.get("/content-management/export", params={"format": "csv"})),
+        ("POST /articles/", 2, lambda c, p: c.post("/articles/", json=p.new_article())),
+        ("PUT /articles/{id}", 2, lambda c, p: c.put(f"/articles/{p.article()}", json={"status": p.rng.choice(["Черновик", "На модерации", "Опубликовано"])})),
+        ("PUT /articles/{id}/full", 1, lambda c, p: c.put(f"/articles/{p.article()}/full", json={"content": " ".join(p.rng.choice(WORDS) for _ in range(80))})),
+        ("POST /comments/", 4, lambda c, p: c.post("/comments/", json=p.new_comment())),
+        ("PUT /comments/{id}/approve", 2, lambda c, p: c.put(f"/comments/{p.rng.choice(p.comments)}/approve")),
+        ("PUT /comments/{id}/unapprove", 1, lambda c, p: c.put(f"/comments/{p.rng.choice(p.comments)}/unapprove")),
+        ("DELETE /comments/{id}", 1, lambda c, p: c.delete(f"/comments/{p.comments.pop(p.rng.randrange(len(p.comments)))}")),
+        ("POST /comments/moderate", 1, lambda c, p: c.post("/comments/moderate", json=[
+            {"comment_id": p.rng.choice(p.comments), "action": p.rng.choice(["approve", "unapprove"])} for _ in range(20)
+        ])),
+        ("POST /articles/bulk", 0.5, lambda c, p: c.post("/articles/bulk", json=[p.new_article() for _ in range(20)])),
+        ("POST /comments/bulk", 1, lambda c, p: c.post("/comments/bulk", json=[p.new_comment() for _ in range(20)])),
+        ("POST /authors/", 0.2, lambda c, p: c.post("/authors/", json={"full_name": f"Автор {p.unique()}", "email": f"{p.unique()}@example.com"})),
+        ("POST /categories/", 0.1, lambda c, p: c.post("/categories/", json={"name": f"Категория {p.unique()}"})),
+        # Переименование обновляет имя во всех статьях автора или категории в фоне: задержка
+        # ответа не включает обновление статей, но оно нагружает базу во время прогона
+        ("PUT /authors/{id}", 0.2, lambda c, p: c.put(f"/authors/{p.rng.choice(p.authors)}", json={"full_name": f"Автор {p.unique()}"})),
+        ("PUT /categories/{id}", 0.1, lambda c, p: c.put(f"/categories/{p.rng.choice(p.categories)}", json={"name": f"Категория {p.unique()}"})),
+    ]
+
+
+# Выборка ID статей, авторов, категорий и комментариев для запросов сценария
+async def fill_pool(client, pool):
+    async def ids(path, **params):
+        response = await client.get(path, params={"limit": 1000, **params})
+        response.raise_for_status()
+        return [doc["_id"] for doc in response.json()]
+
+    pool.articles = await ids("/articles/", fields="title")
+    pool.authors = await ids("/authors/", fields="full_name")
+    pool.categories = await ids("/categories/", fields="name")
+    pool.comments = await ids("/comments/")
+    response = await client.get("/articles/", params={"limit": 50, "fields": "title"})
+    pool.cursor = response.headers.get("x-next-cursor")
+    if not (pool.articles and pool.authors and pool.categories and pool.comments):
+        raise SystemExit("В базе нет данных: заполните ее benchmarks/generate.py")
+
+
+# Ошибка в ответе: HTTP-статус или {"error": ...} в теле (API возвращает ошибки с кодом 200)
+def failed(response):
+    if response.status_code >= 400:
+        return True
+    if response.status_code == 200 and response.headers.get("content-type", "").startswith("application/json"):
+        body = response.json()
+        return isinstance(body, dict) and "error" in body
+    return False
+
+
+# Прогон смеси запросов: concurrency клиентов в течение duration секунд
+async def run_workload(client, pool, concurrency, duration, revalidate):
+    ops = operations()
+    weights = [weight for _, weight, _ in ops]
+    samples = {name: [] for name, _, _ in ops}
+    errors = {name: 0 for name, _, _ in ops}
+    not_modified = {name: 0 for name, _, _ in ops}
+    deadline = time.perf_counter() + duration
+
+    async def worker(etags):
+        while time.perf_counter() < deadline:
+            name, _, request = pool.rng.choices(ops, weights)[0]
+            if name == "DELETE /comments/{id}" and len(pool.comments) < 2:
+                continue
+
+            started = time.perf_counter()
+            if revalidate and name.startswith("GET"):
+                # Браузер повторяет запрос с ETag из своего кэша
+                response = await request(ETagClient(client, etags), pool)
+            else:
+                response = await request(client, pool)
+            samples[name].append(time.perf_counter() - started)
+
+            if response.status_code == 304:
+                not_modified[name] += 1
+            elif failed(response):
+                errors[name] += 1
+            elif name in ("POST /comments/", "POST /comments/bulk"):
+                body = response.json()
+                pool.comments += [item["id"] for item in body.get("results", [body]) if item.get("id")]
+
+    started = time.perf_counter()
+    # У каждого клиента свой кэш ETag, как у отдельной вкладки браузера
+    await asyncio.gather(*(worker({}) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return samples, errors, not_modified, elapsed
+
+
+# Клиент, подставляющий If-None-Match из кэша ETag и запоминающий новые ETag
+class ETagClient:
+    def __init__(self, client, etags):
+        self._client = client
+        self._etags = etags
+
+    async def get(self, path, params=None):
+        key = (path, tuple(sorted((params or {}).items())))
+        headers = {"If-None-Match": self._etags[key]} if key in self._etags else {}
+        response = await self._client.get(path, params=params, headers=headers)
+        if response.headers.get("etag"):
+            self._etags[key] = response.headers["etag"]
+        return response
+
+
+# Процентиль по методу ближайшего ранга
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+# Сводка по эндпоинтам: запросы, ошибки, 304, запросов/с, p50 и p99 в мс
+def summarize(samples, errors, not_modified, elapsed):
+    report = {}
+    for name, values in samples.items():
+        if not values:
+            continue
+        report[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "not_modified": not_modified[name],
+            "rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+    all_values = [value for values in samples.values() for value in values]
+    if all_values:
+        report["TOTAL"] = {
+            "requests": len(all_values),
+            "errors": sum(errors.values()),
+            "not_modified": sum(not_modified.values()),
+            "rps": len(all_values) / elapsed,
+            "p50_ms": percentile(all_values, 50) * 1000,
+            "p99_ms": percentile(all_values, 99) * 1000,
+        }
+    return report
+
+
+# Изменение относительно базового прогона в процентах
+def delta(value, base):
+    if not base:
+        return ""
+    return f"{(value - base) / base * 100:+6.1f}%"
+
+
+def print_report(report, baseline=None):
+    header = f"{'эндпоинт':<34} {'запросов':>8} {'ошибок':>6} {'304':>6} {'запр/с':>8} {'p50, мс':>9} {'p99, мс':>9}"
+    if baseline:
+        header += f" {'Δp50':>8} {'Δp99':>8} {'Δзапр/с':>8}"
+    print(header)
+    for name, row in report.items():
+        line = (f"{name:<34} {row['requests']:>8} {row['errors']:>6} {row['not_modified']:>6} "
+                f"{row['rps']:>8.1f} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+        if baseline and name in baseline:
+            base = baseline[name]
+            line += f" {delta(row['p50_ms'], base['p50_ms']):>8} {delta(row['p99_ms'], base['p99_ms']):>8} {delta(row['rps'], base['rps']):>8}"
+        print(line)
+
+
+# Приложение в памяти: mongomock с синтетическими данными вместо MongoDB
+def in_memory_app(args):
+    import mongomock
+    import mongomock.collection
+    import inspect
+    import main as app_module
+
+    # mongomock не принимает параметры операций bulk_write, добавленные в новых версиях pymongo
+    for name in ("add_insert", "add_update", "add_replace", "add_delete"):
+        original = getattr(mongomock.collection.BulkOperationBuilder, name, None)
+        if original is None:
+            continue
+        accepted = set(inspect.signature(original).parameters)
+
+        def compatible(self, *a, _original=original, _accepted=accepted, **kwargs):
+            return _original(self, *a, **{key: value for key, value in kwargs.items() if key in _accepted})
+        setattr(mongomock.collection.BulkOperationBuilder, name, compatible)
+
+    database = mongomock.MongoClient()["blog_admin_db"]
+    generate(database, args.authors, args.categories, args.articles, args.comments,
+             seed=args.seed, batch_size=1000, content_words=40, log=lambda message: None)
+    # mongomock не поддерживает текстовые индексы, поэтому миграции индексов пропускаются
+    asyncio.run(prepare(database, migrate=False))
+    app_module.db = app_module.ThreadedDatabase(database)
+    return app_module.app
+
+
+async def run(args, app):
+    import httpx
+
+    # Исключения приложения учитываются как ответы 500, а не прерывают прогон
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False) if app else None
+    base_url = args.url or "http://bench"
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60, limits=limits) as client:
+        pool = Pool(random.Random(args.seed))
+        await fill_pool(client, pool)
+        return await run_workload(client, pool, args.concurrency, args.duration, not args.no_revalidate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сценарная нагрузка на API и отчет по задержкам")
+    parser.add_argument("--url", help="Адрес запущенного сервера; без него приложение запускается в памяти на mongomock")
+    parser.add_argument("--concurrency", type=int, default=20, help="Число параллельных клиентов")
+    parser.add_argument("--duration", type=float, default=30, help="Длительность прогона, с")
+    parser.add_argument("--no-revalidate", action="store_true", help="Не отправлять If-None-Match в повторных GET-запросах")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="Сохранить отчет в JSON-файл")
+    parser.add_argument("--baseline", help="Сравнить с отчетом из JSON-файла")
+    # Объемы данных для режима в памяти
+    parser.add_argument("--authors", type=int, default=100)
+    parser.add_argument("--categories", type=int, default=10)
+    parser.add_argument("--articles", type=int, default=2000)
+    parser.add_argument("--comments", type=int, default=10000)
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("main").setLevel(logging.WARNING)
+
+    app = None if args.url else in_memory_app(args)
+    samples, errors, not_modified, elapsed = asyncio.run(run(args, app))
+    report = summarize(samples, errors, not_modified, elapsed)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
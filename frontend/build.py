@@ -0,0 +1,125 @@
+# Сборка статики админ-панели для nginx
+#
+# Копирует страницы frontend в каталог сборки и готовит файлы к долгому кэшированию:
+# - изображения уменьшаются до --image-width пикселей по ширине и сохраняются в JPEG и WebP
+#   (nginx отдает WebP браузерам, которые его принимают, под тем же адресом);
+# - имена CSS, JS и изображений получают хэш содержимого (style.3f2a9c1b.css), ссылки
+#   в HTML и CSS переписываются, поэтому такие файлы кэшируются браузером на год;
+# - текстовые файлы сжимаются заранее (.gz рядом с файлом) для gzip_static в nginx.
+# HTML-страницы сохраняют имена и перепроверяются браузером при каждой загрузке.
+#
+# Запуск:
+#   python frontend/build.py --output dist
+# Требуется: pip install pillow
+
+import argparse
+import gzip
+import hashlib
+import io
+import os
+import re
+import shutil
+
+from PIL import Image
+
+SOURCE = os.path.dirname(os.path.abspath(__file__))
+
+# Файлы, которые попадают в сборку (в порядке обработки: изображения до CSS, который на
+# них ссылается)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+ASSET_EXTENSIONS = (".css", ".js")
+PAGE_EXTENSIONS = (".html",)
+
+# Текстовые файлы, для которых сохраняется сжатая копия
+COMPRESSED_EXTENSIONS = (".html", ".css", ".js")
+
+
+# Имя файла с хэшем содержимого: style.css -> style.3f2a9c1b.css
+def fingerprint(name, content):
+    stem, extension = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:8]}{extension}"
+
+
+# Замена ссылок на исходные имена файлов именами из сборки
+def rewrite_references(text, names):
+    for source, built in names.items():
+        text = re.sub(rf"(?<=[\"'(/]){re.escape(source)}(?=[\"')?#])", built, text)
+    return text
+
+
+# Уменьшенное изображение: (JPEG, WebP)
+def encode_image(path, max_width, jpeg_quality, webp_quality):
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+        if image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+
+        jpeg = io.BytesIO()
+        image.save(jpeg, "JPEG", quality=jpeg_quality, optimize=True, progressive=True)
+        webp = io.BytesIO()
+        image.save(webp, "WEBP", quality=webp_quality, method=6)
+    return jpeg.getvalue(), webp.getvalue()
+
+
+def write(path, content):
+    with open(path, "wb") as file:
+        file.write(content)
+
+
+# Сборка: {исходное имя: имя в сборке}
+def build(output, max_width=1920, jpeg_quality=80, webp_quality=75, log=print):
+    shutil.rmtree(output, ignore_errors=True)
+    os.makedirs(output)
+
+    files = sorted(os.listdir(SOURCE))
+    names = {}
+    written = []
+
+    for name in files:
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        jpeg, webp = encode_image(os.path.join(SOURCE, name), max_width, jpeg_quality, webp_quality)
+        # Изображение сохраняется как JPEG; WebP лежит рядом с суффиксом .webp
+        built = fingerprint(os.path.splitext(name)[0] + ".jpg", jpeg)
+        write(os.path.join(output, built), jpeg)
+        write(os.path.join(output, built + ".webp"), webp)
+        names[name] = built
+        log(f"  {name} ({os.path.getsize(os.path.join(SOURCE, name)) // 1024} КБ) -> "
+            f"{built} ({len(jpeg) // 1024} КБ), {built}.webp ({len(webp) // 1024} КБ)")
+
+    for extensions, hashed in ((ASSET_EXTENSIONS, True), (PAGE_EXTENSIONS, False)):
+        for name in files:
+            if not name.lower().endswith(extensions):
+                continue
+            with open(os.path.join(SOURCE, name), encoding="utf-8") as file:
+                content = rewrite_references(file.read(), names).encode("utf-8")
+            built = fingerprint(name, content) if hashed else name
+            write(os.path.join(output, built), content)
+            written.append(built)
+            if hashed:
+                names[name] = built
+                log(f"  {name} -> {built}")
+
+    # Сжатые копии (mtime = 0: одинаковое содержимое дает одинаковый файл)
+    for name in written:
+        if name.lower().endswith(COMPRESSED_EXTENSIONS):
+            with open(os.path.join(output, name), "rb") as file:
+                write(os.path.join(output, name + ".gz"), gzip.compress(file.read(), compresslevel=9, mtime=0))
+
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка статики админ-панели")
+    parser.add_argument("--output", default=os.path.join(SOURCE, "dist"), help="Каталог сборки (очищается)")
+    parser.add_argument("--image-width", type=int, default=1920, help="Максимальная ширина изображений, px")
+    parser.add_argument("--jpeg-quality", type=int, default=80)
+    parser.add_argument("--webp-quality", type=int, default=75)
+    args = parser.parse_args()
+
+    build(args.output, args.image_width, args.jpeg_quality, args.webp_quality)
+    print(f"Готово: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -122,7 +122,7 @@ async function loadAuthors() {
     if (authorsCache) return authorsCache;
     
     try {
-        const authors = await fetchData('/authors/');
+        const authors = await fetchData('/authors/', { limit: 1000 });
         authorsCache = authors;
         return authors;
     } catch (error) {
@@ -137,7 +137,7 @@ async function loadCategories() {
     if (categoriesCache) return categoriesCache;
     
     try {
-        const categories = await fetchData('/categories/');
+        const categories = await fetchData('/categories/', { limit: 1000 });
         categoriesCache = categories;
         return categories;
     } catch (error) {